@@ -0,0 +1,284 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Imports
+import numpy as np
+import time
+from scene.scene import Scene
+from scene.materials import BaseMaterial, CheckerMaterial, GradientMaterial, NoiseMaterial
+from scene.objects.primative import *
+from scene.objects.mesh import *
+from scene.lights import PointLight
+from renderer import render_image, render_views, shade_materials, ambient_occlusion
+from camera import Camera
+from path_tracer import PathTracer
+from util import set_precision
+
+# Benchmark Settings
+image_width = 64
+image_height = 36
+
+min_distance = 0.001
+max_distance = 25
+
+
+def desk_scene(**settings):
+    dark_wood_mat = BaseMaterial((77, 32, 21))
+    light_wood_mat = BaseMaterial((195, 178, 159))
+    blue_mat = BaseMaterial((4, 111, 147))
+
+    objects = (
+        Plane("Z", 0, blue_mat),
+        RoundBox((0, 0, -0.6), (2, 0.5, 0.05), 0.0, dark_wood_mat),
+        RoundBox((0, 0, -0.55), (2, 0.5, 0.05), 0.0, dark_wood_mat),
+        Box((-0.9, 0, -0.26), (0.05, 0.4, 0.55), dark_wood_mat),
+        Box((-0.4, 0, -0.26), (0.05, 0.4, 0.55), dark_wood_mat),
+        Box((0.9, 0, -0.26), (0.05, 0.4, 0.55), dark_wood_mat),
+        Box((-0.65, 0, -0.425), (0.45, 0.37, 0.2), light_wood_mat),
+        Box((-0.65, 0, -0.175), (0.45, 0.37, 0.2), light_wood_mat),
+        Box((-0.65, 0, -0.3), (0.45, 0.4, 0.05), dark_wood_mat),
+        Box((-0.65, 0, -0.05), (0.45, 0.4, 0.05), dark_wood_mat),
+    )
+    lights = (
+        PointLight((-1, -1, -1), 2, (255, 255, 255)),
+        PointLight((1, -1, -1), 2, (255, 255, 255)),
+        PointLight((0, 0, -2), 2, (255, 255, 255)),
+    )
+
+    return Scene(objects, lights, min_distance, max_distance, True, **settings)
+
+
+def mesh_scene(**settings):
+    objects = (
+        Plane("Z", 0, BaseMaterial((4, 111, 147))),
+        MeshObject((0, 0, -1), (0.3, 0.3, 0.3), "box.stl", BaseMaterial((177, 103, 57))),
+    )
+    lights = (PointLight((-1, -1, -1), 2, (255, 255, 255)),)
+
+    return Scene(objects, lights, min_distance, max_distance, True, **settings)
+
+
+def textured_scene(**settings):
+    objects = (
+        Plane("Z", 0, CheckerMaterial((230, 230, 230), (40, 40, 40), 0.25)),
+        Sphere((-0.6, 0, -0.4), 0.4, NoiseMaterial((200, 60, 20), (20, 60, 200), 0.3, octaves=5)),
+        Box((0.6, 0, -0.3), (0.5, 0.5, 0.6), GradientMaterial((255, 200, 0), (0, 80, 255), (0, 0, 0), (0, 0, -0.6))),
+    )
+    lights = (PointLight((-1, -1, -1.5), 2, (255, 255, 255)),)
+
+    return Scene(objects, lights, min_distance, max_distance, True, **settings)
+
+
+scenes = {"desk": desk_scene, "mesh": mesh_scene, "textured": textured_scene}
+
+
+def benchmark_camera():
+    return Camera((0, -1.5, -1), (0.4636, 0, 0), fov=90)
+
+
+def timed_render(scene, camera=None):
+    camera = camera or benchmark_camera()
+
+    start_time = time.time()
+    colors, buffers = render_image(scene, camera, image_width, image_height, progress=False)
+
+    return colors, buffers.steps, time.time() - start_time
+
+
+def image_difference(a: np.ndarray, b: np.ndarray):
+    difference = np.abs(np.subtract(a, b, dtype=float))
+    return difference.mean(), difference.max()
+
+
+def benchmark_epsilon():
+    print("Adaptive hit epsilon and step budget")
+
+    for name, make_scene in scenes.items():
+        fixed, fixed_steps, fixed_time = timed_render(make_scene(adaptive_epsilon=False, max_steps=100000))
+        adaptive, adaptive_steps, adaptive_time = timed_render(make_scene())
+
+        mean_difference, max_difference = image_difference(fixed, adaptive)
+
+        print(f"  {name}:")
+        print(f"    fixed:    {fixed_time:6.2f} s, steps mean {fixed_steps.mean():6.1f}, max {fixed_steps.max()}")
+        print(f"    adaptive: {adaptive_time:6.2f} s, steps mean {adaptive_steps.mean():6.1f}, max {adaptive_steps.max()}")
+        print(f"    image difference: mean {mean_difference:.2f}, max {max_difference:.2f}")
+
+
+def data_size(scene, camera):
+    """Adds up the bytes of the ray and geometry arrays a render of the scene works with."""
+
+    arrays = [camera.getRayDirections(image_width, image_height)]
+
+    for object in scene.objects:
+        geometry = getattr(object, "geometry", None)
+        if geometry is not None:
+            arrays += [
+                geometry.vertices,
+                geometry.triangles,
+                geometry.face_normals,
+                geometry.feature_normals,
+            ]
+
+    return sum(array.nbytes for array in arrays)
+
+
+def benchmark_precision():
+    print("float64 and float32 precision")
+
+    for name, make_scene in scenes.items():
+        results = {}
+
+        for precision in ("float64", "float32"):
+            # Everything has to be built after the precision is set
+            set_precision(precision)
+            scene = make_scene()
+            camera = benchmark_camera()
+
+            colors, steps, render_time = timed_render(scene, camera)
+            results[precision] = colors
+
+            print(
+                f"  {name} {precision}: {render_time:6.2f} s, "
+                f"{image_width * image_height / render_time:7.1f} pixels/s, "
+                f"{data_size(scene, camera) / 1024:7.1f} KiB of ray and mesh data, "
+                f"steps mean {steps.mean():5.1f}"
+            )
+
+        set_precision("float64")
+
+        mean_difference, max_difference = image_difference(results["float64"], results["float32"])
+        print(f"  {name} image difference: mean {mean_difference:.3f}, max {max_difference:.3f}")
+
+
+def benchmark_occlusion():
+    print("Ambient occlusion")
+
+    for name, make_scene in scenes.items():
+        for samples in (0, 3, 5, 8):
+            scene = make_scene(occlusion_samples=samples)
+            camera = benchmark_camera()
+
+            colors, steps, render_time = timed_render(scene, camera)
+
+            # Time the occlusion pass on its own, over buffers rendered without it
+            _, buffers = render_image(scene, camera, image_width, image_height, progress=False)
+            directions = camera.getRayDirections(image_width, image_height)
+
+            start_time = time.time()
+            occlusion = ambient_occlusion(scene, camera, directions, buffers)
+            occlusion_time = time.time() - start_time
+
+            hits = np.isfinite(buffers.depth).sum()
+            print(
+                f"  {name} {samples} samples: render {render_time:6.2f} s, "
+                f"occlusion {occlusion_time * 1000:7.1f} ms for {hits} hit points "
+                f"({occlusion_time / max(hits, 1) * 1e6:6.1f} us each), "
+                f"mean occlusion {occlusion[np.isfinite(buffers.depth)].mean():.3f}"
+            )
+
+
+def benchmark_materials():
+    print("Batched material evaluation")
+
+    for name, make_scene in scenes.items():
+        scene = make_scene()
+        camera = benchmark_camera()
+
+        colors, steps, render_time = timed_render(scene, camera)
+
+        # Shade again from the same buffers, to time the material pass on its own
+        _, buffers = render_image(scene, camera, image_width, image_height, progress=False)
+        directions = camera.getRayDirections(image_width, image_height)
+
+        start_time = time.time()
+        shade_materials(scene, camera, directions, buffers)
+        material_time = time.time() - start_time
+
+        print(
+            f"  {name}: render {render_time:6.2f} s, materials {material_time * 1000:6.1f} ms "
+            f"({material_time / render_time * 100:.2f}% of the frame) "
+            f"for {np.isfinite(buffers.depth).sum()} hit points and {len(scene.materials)} materials"
+        )
+
+
+def benchmark_path_tracing(threshold: float = 0.05, time_budget: float = 60):
+    print("Path tracing with adaptive sampling")
+
+    for name, make_scene in scenes.items():
+        print(f"  {name}:")
+
+        tracer = PathTracer(make_scene(), benchmark_camera(), image_width, image_height)
+        tracer.render(threshold, time_budget)
+        tracer.printStatistics(threshold)
+
+
+def turntable_cameras(views: int):
+    cameras = []
+
+    for view in range(views):
+        angle = 2 * np.pi * view / views
+        camera = Camera((1.8 * np.sin(angle), -1.8 * np.cos(angle), -1), fov=90)
+        camera.lookAt((0, 0, -0.3))
+        cameras.append(camera)
+
+    return cameras
+
+
+def benchmark_views(views: int = 8):
+    print(f"Multi-view batch rendering, {views} views")
+
+    cameras = turntable_cameras(views)
+    pixels = views * image_width * image_height
+
+    for name, make_scene in scenes.items():
+        # One run per view, each building its own scene
+        start_time = time.time()
+        sequential = [
+            render_image(make_scene(), camera, image_width, image_height, progress=False)[0] for camera in cameras
+        ]
+        sequential_time = time.time() - start_time
+
+        # The same, marching each view in one batch on its own, so only the shared setup differs from below
+        start_time = time.time()
+        single = [
+            render_views(make_scene(), [camera], image_width, image_height, progress=False)[0][0]
+            for camera in cameras
+        ]
+        single_time = time.time() - start_time
+
+        start_time = time.time()
+        batched = render_views(make_scene(), cameras, image_width, image_height, progress=False)
+        batched_time = time.time() - start_time
+
+        differences = [image_difference(a, b) for a, (b, _) in zip(sequential, batched)]
+        single_differences = [image_difference(a, b) for a, (b, _) in zip(single, batched)]
+
+        print(f"  {name}:")
+        print(f"    render_image per view: {sequential_time:6.2f} s, {pixels / sequential_time:8.0f} pixels/s")
+        print(f"    render_views per view: {single_time:6.2f} s, {pixels / single_time:8.0f} pixels/s")
+        print(
+            f"    render_views batched:  {batched_time:6.2f} s, {pixels / batched_time:8.0f} pixels/s, "
+            f"{single_time / batched_time:.2f}x faster than per view"
+        )
+        print(
+            f"    image difference: mean {np.mean([mean for mean, _ in differences]):.4f}, "
+            f"max {max(maximum for _, maximum in differences + single_differences):.4f}"
+        )
+
+
+benchmarks = {
+    "epsilon": benchmark_epsilon,
+    "precision": benchmark_precision,
+    "occlusion": benchmark_occlusion,
+    "materials": benchmark_materials,
+    "path_tracing": benchmark_path_tracing,
+    "views": benchmark_views,
+}
+
+
+if __name__ == "__main__":
+    # Run the benchmarks named on the command line, or all of them
+    for name in sys.argv[1:] or benchmarks:
+        benchmarks[name]()
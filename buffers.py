@@ -0,0 +1,117 @@
+import numpy as np
+import os
+from PIL import Image
+
+
+class RenderBuffers:
+    """
+    Holds the per-pixel data a render produces alongside its colors.
+
+    The step count is always recorded. Depth, world normal, object ID and material ID
+    are only allocated and written when `auxiliary` is set. Pixels whose ray missed
+    keep an infinite depth, a zero normal and IDs of -1.
+
+    With `deferred` set, the light reaching every hit is recorded too, and the
+    material colors are left to be worked out afterwards from these buffers.
+    """
+
+    def __init__(
+        self, image_width: int, image_height: int, auxiliary: bool = False, deferred: bool = False
+    ) -> None:
+        self.image_width = image_width
+        self.image_height = image_height
+
+        # Deferred materials need to know where every hit is and what it hit
+        self.auxiliary = auxiliary or deferred
+        self.deferred = deferred
+
+        self.steps = np.zeros((image_height, image_width), dtype=np.int32)
+
+        self.depth = None
+        self.normal = None
+        self.object_id = None
+        self.material_id = None
+        self.irradiance = None
+
+        if deferred:
+            self.irradiance = np.zeros((image_height, image_width, 3), dtype=np.float32)
+
+        if self.auxiliary:
+            self.depth = np.full((image_height, image_width), np.inf, dtype=np.float32)
+            self.normal = np.zeros((image_height, image_width, 3), dtype=np.float32)
+            self.object_id = np.full((image_height, image_width), -1, dtype=np.int32)
+            self.material_id = np.full((image_height, image_width), -1, dtype=np.int32)
+
+    def getArrays(self, region=np.s_[:, :]) -> dict:
+        """
+        Collects every allocated buffer.
+
+        ## Args:
+            `region`: Only return this (rows, columns) slice of each buffer.
+
+        ## Returns:
+            A dictionary of arrays by buffer name.
+        """
+
+        arrays = {"steps": self.steps[region]}
+
+        if self.auxiliary:
+            arrays["depth"] = self.depth[region]
+            arrays["normal"] = self.normal[region]
+            arrays["object_id"] = self.object_id[region]
+            arrays["material_id"] = self.material_id[region]
+
+        if self.deferred:
+            arrays["irradiance"] = self.irradiance[region]
+
+        return arrays
+
+    def setArrays(self, arrays: dict, region=np.s_[:, :]):
+        for name, array in arrays.items():
+            buffer = getattr(self, name, None)
+            if isinstance(buffer, np.ndarray):
+                buffer[region] = array
+
+    def save(self, file_name: str):
+        """Saves every allocated buffer into one .npz file."""
+
+        np.savez_compressed(file_name, **self.getArrays())
+
+    def saveImages(self, directory: str):
+        """
+        Saves the buffers as viewable images.
+
+        Normals are mapped from -1..1 to an RGB image, depth to a 16-bit grayscale
+        image scaled to the nearest and farthest hit, and IDs (offset by one, so misses
+        are 0) and step counts to 16-bit grayscale images.
+
+        ## Args:
+            `directory`: Folder to write `steps.png`, `depth.png`, `normal.png`, `object_id.png` and `material_id.png` to.
+        """
+
+        os.makedirs(directory, exist_ok=True)
+
+        def save_16_bit(array, name):
+            Image.fromarray(np.clip(array, 0, 65535).astype(np.uint16)).save(
+                os.path.join(directory, name)
+            )
+
+        save_16_bit(self.steps, "steps.png")
+
+        if not self.auxiliary:
+            return
+
+        hit = np.isfinite(self.depth)
+        depth = np.zeros(self.depth.shape)
+        if hit.any():
+            near, far = self.depth[hit].min(), self.depth[hit].max()
+            depth[hit] = 1 - (self.depth[hit] - near) / max(far - near, 1e-9)
+        save_16_bit(depth * 65535, "depth.png")
+
+        normal = ((self.normal + 1) * 127.5) * hit[:, :, np.newaxis]
+        Image.fromarray(np.clip(normal, 0, 255).astype(np.uint8), mode="RGB").save(
+            os.path.join(directory, "normal.png")
+        )
+
+        save_16_bit(self.object_id + 1, "object_id.png")
+        save_16_bit(self.material_id + 1, "material_id.png")
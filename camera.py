@@ -0,0 +1,166 @@
+import numpy as np
+import math
+from util import as_real, get_dtype
+
+
+class Camera:
+    """
+    Defines a pinhole camera.
+
+    The camera looks down +Y with +X to the right and +Z down the image,
+    matching the scene's coordinate system. `rotation` is a (pitch, yaw, roll)
+    tuple in radians: pitch turns about the X axis (positive tilts towards +Z),
+    yaw turns about the Z axis and roll turns about the viewing direction.
+    """
+
+    def __init__(
+        self,
+        pos: np.ndarray,
+        rotation: np.ndarray = (0, 0, 0),
+        fov: float = 90,
+        aspect_ratio: float = None,
+    ) -> None:
+        self.pos = as_real(pos)
+        self.rotation = tuple(rotation)
+        self.fov = fov
+        self.aspect_ratio = aspect_ratio
+
+        # Primary ray directions only depend on the orientation, fov and resolution,
+        # so they are kept around until one of those changes
+        self._directions = {}
+
+    def getPosition(self):
+        return self.pos
+
+    def setPosition(self, pos: np.ndarray):
+        # Moving the camera does not change any ray directions, so the cache stays valid
+        self.pos = as_real(pos)
+
+    def getRotation(self):
+        return self.rotation
+
+    def setRotation(self, rotation: np.ndarray):
+        self.rotation = tuple(rotation)
+        self._directions = {}
+
+    def getFov(self):
+        return self.fov
+
+    def setFov(self, fov: float):
+        self.fov = fov
+        self._directions = {}
+
+    def lookAt(self, target: np.ndarray, roll: float = 0):
+        """
+        Points the camera at a position in the scene.
+
+        ## Args:
+            `target`: The position to look at.
+            `roll`: Rotation about the viewing direction, in radians.
+        """
+
+        forward = np.subtract(target, self.pos)
+        forward = forward / np.linalg.norm(forward)
+
+        pitch = math.asin(np.clip(forward[2], -1, 1))
+        yaw = math.atan2(-forward[0], forward[1])
+
+        self.setRotation((pitch, yaw, roll))
+
+    def getRotationMatrix(self) -> np.ndarray:
+        """
+        Builds the camera-to-world rotation matrix from the Euler angles.
+
+        ## Returns:
+            A 3x3 rotation matrix.
+        """
+
+        pitch, yaw, roll = self.rotation
+
+        cp, sp = math.cos(pitch), math.sin(pitch)
+        cy, sy = math.cos(yaw), math.sin(yaw)
+        cr, sr = math.cos(roll), math.sin(roll)
+
+        rotate_x = np.array(((1, 0, 0), (0, cp, -sp), (0, sp, cp)))
+        rotate_y = np.array(((cr, 0, sr), (0, 1, 0), (-sr, 0, cr)))
+        rotate_z = np.array(((cy, -sy, 0), (sy, cy, 0), (0, 0, 1)))
+
+        return rotate_z @ rotate_x @ rotate_y
+
+    def getPixelAngle(self, image_width: int) -> float:
+        """
+        Calculates the angle covered by a single pixel at the center of the image.
+
+        ## Args:
+            `image_width`: Width of the image in pixels.
+
+        ## Returns:
+            The approximate angular size of one pixel, in radians.
+        """
+
+        return 2 * math.tan(math.radians(self.fov) / 2) / image_width
+
+    def getDirections(self, x: np.ndarray, y: np.ndarray, image_width: int, image_height: int) -> np.ndarray:
+        """
+        Calculates the direction of rays through any points on the image.
+
+        ## Args:
+            `x`: Horizontal positions in pixels, from 0 at the left edge to `image_width` at the right.
+            `y`: Vertical positions in pixels, from 0 at the top edge to `image_height` at the bottom.
+            `image_width`: Width of the image in pixels.
+            `image_height`: Height of the image in pixels.
+
+        ## Returns:
+            An array of normalized directions, the shape `x` and `y` broadcast to with a last axis of 3.
+        """
+
+        aspect_ratio = self.aspect_ratio
+        if aspect_ratio is None:
+            aspect_ratio = image_width / image_height
+
+        half_width = math.tan(math.radians(self.fov) / 2)
+        half_height = half_width / aspect_ratio
+
+        u, v = np.broadcast_arrays(
+            (np.asarray(x) / image_width * 2 - 1) * half_width,
+            (np.asarray(y) / image_height * 2 - 1) * half_height,
+        )
+
+        directions = np.empty(u.shape + (3,))
+        directions[..., 0] = u
+        directions[..., 1] = 1.0
+        directions[..., 2] = v
+
+        directions = directions @ self.getRotationMatrix().T
+        directions /= np.linalg.norm(directions, axis=-1, keepdims=True)
+        return directions
+
+    def getRayDirections(self, image_width: int, image_height: int) -> np.ndarray:
+        """
+        Generates the direction of every primary ray for a resolution.
+
+        The result is cached, so repeated frames (and every tile of a frame)
+        share the same buffer. Do not modify the returned array.
+
+        ## Args:
+            `image_width`: Width of the image in pixels.
+            `image_height`: Height of the image in pixels.
+
+        ## Returns:
+            A (height, width, 3) array of normalized ray directions.
+        """
+
+        key = (image_width, image_height, get_dtype())
+        if key in self._directions:
+            return self._directions[key]
+
+        # Sample through the center of each pixel
+        x = np.arange(image_width)[np.newaxis, :] + 0.5
+        y = np.arange(image_height)[:, np.newaxis] + 0.5
+
+        directions = self.getDirections(x, y, image_width, image_height)
+        directions = directions.astype(get_dtype())
+        directions.flags.writeable = False
+
+        self._directions[key] = directions
+        return directions
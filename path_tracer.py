@@ -0,0 +1,277 @@
+import numpy as np
+import time
+from scene.scene import Scene
+from camera import Camera
+from renderer import march
+from util import get_dtype, get_hit_epsilon
+
+# Weights of the red, green and blue channels in a color's perceived brightness
+luminance_weights = np.array((0.2126, 0.7152, 0.0722))
+
+
+def _cosine_directions(normals: np.ndarray, random: np.random.Generator) -> np.ndarray:
+    """Picks a random direction around every normal, more likely the closer it is to the normal."""
+
+    count = len(normals)
+    r1, r2 = random.random(count), random.random(count)
+
+    phi = 2 * np.pi * r1
+    radius = np.sqrt(r2)
+
+    # An orthonormal basis around each normal, without branching on its direction
+    x, y, z = normals[:, 0], normals[:, 1], normals[:, 2]
+    sign = np.where(z >= 0, 1.0, -1.0)
+    a = -1 / (sign + z)
+    b = x * y * a
+    tangent = np.stack((1 + sign * x * x * a, sign * b, -sign * x), axis=1)
+    bitangent = np.stack((b, sign + y * y * a, -y), axis=1)
+
+    directions = (
+        tangent * (radius * np.cos(phi))[:, np.newaxis]
+        + bitangent * (radius * np.sin(phi))[:, np.newaxis]
+        + normals * np.sqrt(1 - r2)[:, np.newaxis]
+    )
+    return directions.astype(normals.dtype)
+
+
+class PathTracer:
+    """
+    Renders global illumination by averaging random light paths through every pixel.
+
+    Every path gathers direct light from each light at each bounce, then carries on
+    in a random diffuse direction, so light bounced off other surfaces is included.
+    Rays escaping the scene after a bounce pick up the scene's ambient light. After
+    `min_bounces`, paths are ended at random with a chance that grows as less of their
+    light is left (Russian roulette), and the survivors are weighted up to make up for it.
+
+    Samples are spent where they are needed: after a few samples everywhere, only pixels
+    whose estimated error is still above the threshold are sampled again.
+    """
+
+    def __init__(
+        self,
+        scene: Scene,
+        camera: Camera,
+        image_width: int,
+        image_height: int,
+        max_bounces: int = 8,
+        min_bounces: int = 2,
+        seed: int = 0,
+    ) -> None:
+        self.scene = scene
+        self.camera = camera
+        self.image_width = image_width
+        self.image_height = image_height
+        self.max_bounces = max_bounces
+        self.min_bounces = min_bounces
+
+        self.random = np.random.default_rng(seed)
+
+        pixels = image_width * image_height
+        self.color_sum = np.zeros((pixels, 3))
+        self.luminance_sum = np.zeros(pixels)
+        self.luminance_squares = np.zeros(pixels)
+        self.samples = np.zeros(pixels, dtype=np.int64)
+
+        self.paths_traced = 0
+        self.max_samples = None
+        self.render_time = 0.0
+        self.time_to_convergence = None
+
+    def getImage(self) -> np.ndarray:
+        """Returns the average of every sample so far, as a (height, width, 3) array of HDR colors."""
+
+        colors = self.color_sum / np.maximum(self.samples, 1)[:, np.newaxis]
+        return colors.reshape(self.image_height, self.image_width, 3)
+
+    def getError(self, error_floor: float = 8.0) -> np.ndarray:
+        """
+        Estimates how far every pixel's average could still be from its converged color.
+
+        ## Args:
+            `error_floor`: Pixels darker than this are judged by absolute instead of relative error,
+                so near black pixels don't soak up samples.
+
+        ## Returns:
+            An (pixels,) array of the standard error of each pixel's mean luminance, relative to
+            the mean. Infinite for pixels with fewer than two samples.
+        """
+
+        samples = self.samples.astype(float)
+        mean = self.luminance_sum / np.maximum(samples, 1)
+        variance = np.maximum(self.luminance_squares - samples * mean * mean, 0) / np.maximum(samples - 1, 1)
+
+        error = np.sqrt(variance / np.maximum(samples, 1)) / np.maximum(mean, error_floor)
+        return np.where(samples >= 2, error, np.inf)
+
+    def _tracePaths(self, pixels: np.ndarray) -> np.ndarray:
+        """
+        Follows one random path through each of a batch of pixels.
+
+        ## Args:
+            `pixels`: Indices of the pixels to trace, in row major order. May repeat.
+
+        ## Returns:
+            An (N, 3) array of the light every path brought back.
+        """
+
+        scene = self.scene
+        dtype = get_dtype()
+        count = len(pixels)
+
+        # Jitter every sample within its pixel, which also antialiases edges
+        y, x = np.divmod(pixels, self.image_width)
+        directions = self.camera.getDirections(
+            x + self.random.random(count), y + self.random.random(count), self.image_width, self.image_height
+        ).astype(dtype)
+        origins = np.broadcast_to(self.camera.getPosition(), (count, 3)).astype(dtype)
+
+        radiance = np.zeros((count, 3))
+        throughput = np.ones((count, 3))
+        paths = np.arange(count)
+
+        pixel_angle = self.camera.getPixelAngle(self.image_width)
+        ambient = scene.getAmbient()
+
+        for bounce in range(self.max_bounces):
+            traveled, hits, _ = march(scene, origins, directions, pixel_angle if bounce == 0 else 0.0)
+
+            # Escaping the scene after a bounce picks up the ambient light, straight from the camera it's a miss
+            if bounce > 0:
+                radiance[paths[~hits]] += throughput[~hits] * ambient
+
+            paths, origins, directions, throughput = paths[hits], origins[hits], directions[hits], throughput[hits]
+            if not len(paths):
+                break
+
+            positions = origins + directions * traveled[hits, np.newaxis]
+
+            # The same normals and materials a direct render uses, for every hit at once
+            indices = scene.getNearestObjectIndices(positions)
+            normals = scene.getNormals(positions, indices)
+            throughput = throughput * scene.getMaterialColors(positions, normals, indices) / 255
+
+            # Move away from the surface a bit, so new rays don't hit it straight away
+            offset = get_hit_epsilon(scene.min_distance, np.max(np.abs(positions), axis=1)) * 2
+            positions = positions + normals * offset[:, np.newaxis]
+
+            # Direct light from every light, unless something is in the way
+            for light in scene.lights:
+                to_light = light.getPosition() - positions
+                light_distances = np.linalg.norm(to_light, axis=1)
+                to_light /= light_distances[:, np.newaxis]
+
+                brightness = np.clip(np.einsum("ij,ij->i", to_light, normals), 0, 1)
+                facing = np.flatnonzero(brightness > 0)
+
+                _, blocked, _ = march(scene, positions[facing], to_light[facing], 0.0, light_distances[facing])
+                brightness[facing[blocked]] = 0
+
+                light_color = np.multiply(light.getColor(), light.getIntensity())
+                radiance[paths] += throughput * np.multiply.outer(brightness, light_color)
+
+            # Russian roulette, paths carrying little light are ended early
+            if bounce + 1 >= self.min_bounces:
+                survival = np.clip(throughput.max(axis=1), 0.05, 1)
+                alive = self.random.random(len(paths)) < survival
+
+                paths, positions, normals = paths[alive], positions[alive], normals[alive]
+                throughput = throughput[alive] / survival[alive, np.newaxis]
+
+                if not len(paths):
+                    break
+
+            origins = positions
+            directions = _cosine_directions(normals, self.random)
+
+        self.paths_traced += count
+        return radiance
+
+    def sample(self, pixels: np.ndarray):
+        """Traces one more path through each of the given pixels and adds it to their averages."""
+
+        radiance = self._tracePaths(pixels)
+        luminance = radiance @ luminance_weights
+
+        np.add.at(self.color_sum, pixels, radiance)
+        np.add.at(self.luminance_sum, pixels, luminance)
+        np.add.at(self.luminance_squares, pixels, luminance * luminance)
+        np.add.at(self.samples, pixels, 1)
+
+    def render(
+        self,
+        threshold: float = 0.05,
+        time_budget: float = None,
+        initial_samples: int = 4,
+        samples_per_pass: int = 4,
+        max_samples: int = 1024,
+        on_update=None,
+    ) -> np.ndarray:
+        """
+        Samples the image until every pixel converges or the time budget runs out.
+
+        ## Args:
+            `threshold`: A pixel has converged once its relative error, see `getError`, is below this.
+            `time_budget`: Seconds to stop after, once the initial samples are done. `None` for no limit.
+            `initial_samples`: Samples every pixel gets before any error is estimated.
+            `samples_per_pass`: Samples added to each unconverged pixel per pass.
+            `max_samples`: Pixels stop being sampled after this many samples, converged or not.
+            `on_update`: Called with this `PathTracer` after every pass.
+
+        ## Returns:
+            A (height, width, 3) array of HDR colors.
+        """
+
+        start_time = time.time()
+        self.max_samples = max_samples
+        every_pixel = np.arange(self.image_width * self.image_height)
+
+        for _ in range(initial_samples):
+            self.sample(every_pixel)
+
+        while True:
+            if on_update is not None:
+                on_update(self)
+
+            unconverged = np.flatnonzero((self.getError() > threshold) & (self.samples < max_samples))
+
+            if not len(unconverged):
+                self.time_to_convergence = time.time() - start_time
+                break
+
+            if time_budget is not None and time.time() - start_time >= time_budget:
+                break
+
+            self.sample(np.repeat(unconverged, samples_per_pass))
+
+        self.render_time = time.time() - start_time
+        return self.getImage()
+
+    def printStatistics(self, threshold: float = 0.05):
+        """Prints how samples were spread over the pixels, and how long the image took to converge."""
+
+        samples = self.samples
+        converged = (self.getError() <= threshold).mean() * 100
+
+        print(
+            f"Samples per pixel: min {samples.min()}, median {np.median(samples):.0f}, "
+            f"mean {samples.mean():.1f}, max {samples.max()}"
+        )
+
+        # How many pixels needed up to each power of two samples
+        edges = 2 ** np.arange(int(np.log2(max(samples.max(), 1))) + 2)
+        counts, _ = np.histogram(samples, bins=np.append(edges, np.inf))
+        for low, count in zip(edges, counts):
+            if count:
+                print(f"  {low:5d} - {low * 2 - 1:5d} samples: {count} pixels ({count / len(samples) * 100:.1f}%)")
+
+        if self.time_to_convergence is not None:
+            capped = (self.getError() > threshold).sum()
+            print(
+                f"Converged in {self.time_to_convergence:.2f} seconds, "
+                f"{capped} pixels stopped at {self.max_samples} samples without converging"
+            )
+        else:
+            print(f"Stopped after {self.render_time:.2f} seconds with {converged:.1f}% of pixels converged")
+
+        print(f"Traced {self.paths_traced} paths, {self.paths_traced / max(self.render_time, 1e-9):.0f} paths/s")
@@ -0,0 +1,154 @@
+import numpy as np
+import math
+import time
+from PIL import Image
+
+
+class ProgressiveRenderer:
+    """
+    Renders an image in interleaved passes, from coarse to fine.
+
+    The first pass renders one pixel per `coarse_step` x `coarse_step` block and
+    stretches it over the block. Every following pass halves the block size,
+    refining the blocks that differ most from their neighbours first, so edges
+    and busy regions sharpen before flat ones.
+
+    Samples are rendered in batches of up to `batch_size` pixels, in priority order,
+    and the time budget is checked between batches. Only the first pass ignores it,
+    so `coarse_step` is kept large: at 32, a 720p image needs about a thousand samples
+    before anything is shown.
+    """
+
+    def __init__(
+        self, render_pixels, image_width: int, image_height: int, coarse_step: int = 32, batch_size: int = 1024
+    ) -> None:
+        # Called with (N,) arrays of columns and rows, returns an (N, 3) array of their colors
+        self.render_pixels = render_pixels
+        self.batch_size = batch_size
+        self.image_width = image_width
+        self.image_height = image_height
+
+        # Round the coarse step up to a power of two so passes halve cleanly
+        self.coarse_step = 2 ** max(0, math.ceil(math.log2(coarse_step)))
+
+        self.color = np.zeros((image_height, image_width, 3))
+
+        # Size of the block each pixel's current color was rendered for, 0 means not rendered yet
+        self.level = np.zeros((image_height, image_width), dtype=int)
+
+        self.pixels_rendered = 0
+
+    def getImage(self) -> Image:
+        return Image.fromarray(np.clip(self.color, 0, 255).astype(np.uint8), mode="RGB")
+
+    def _renderBlocks(self, xs, ys, step):
+        colors = self.render_pixels(np.asarray(xs), np.asarray(ys))
+
+        # Stretch every sample over the pixels in its block that have only coarser data
+        for x, y, color in zip(xs, ys, colors):
+            block = self.level[y : y + step, x : x + step]
+            stale = (block == 0) | (block > step)
+            self.color[y : y + step, x : x + step][stale] = color
+            block[stale] = step
+
+        self.pixels_rendered += len(xs)
+
+    def _getPriorities(self, step):
+        """
+        Scores every block of size `step` by how much its color differs from its neighbours.
+
+        ## Args:
+            `step`: Size of the blocks rendered by the previous pass.
+
+        ## Returns:
+            A list of (priority, x, y) tuples for blocks that can be refined.
+        """
+
+        anchors = self.color[::step, ::step]
+        refinable = self.level[::step, ::step] == step
+
+        difference = np.zeros(anchors.shape[:2])
+        for axis in (0, 1):
+            delta = np.abs(np.diff(anchors, axis=axis)).max(axis=2)
+            if axis == 0:
+                difference[1:, :] = np.maximum(difference[1:, :], delta)
+                difference[:-1, :] = np.maximum(difference[:-1, :], delta)
+            else:
+                difference[:, 1:] = np.maximum(difference[:, 1:], delta)
+                difference[:, :-1] = np.maximum(difference[:, :-1], delta)
+
+        priorities = []
+        for j, i in zip(*np.nonzero(refinable)):
+            priorities.append((difference[j, i], i * step, j * step))
+
+        priorities.sort(key=lambda priority: priority[0], reverse=True)
+        return priorities
+
+    def render(self, time_budget: float = None, quality: float = None, on_update=None) -> Image:
+        """
+        Renders passes until the image is complete, the time budget runs out,
+        or every remaining block is within the quality target.
+
+        ## Args:
+            `time_budget`: Wall-clock seconds to spend, or `None` for no limit.
+            `quality`: Blocks whose color differs from all neighbours by less than
+                this (in 0-255 units) are not refined further. `None` refines everything.
+            `on_update`: Called with the current image after every pass.
+
+        ## Returns:
+            The most refined image rendered within the budget.
+        """
+
+        deadline = None if time_budget is None else time.time() + time_budget
+
+        def out_of_time():
+            return deadline is not None and time.time() >= deadline
+
+        # Coarse pass, always finished in one batch, otherwise there is nothing to show.
+        # It is a small fraction of the image, every finer pass stops at the deadline
+        step = self.coarse_step
+        ys, xs = np.nonzero(self.level[::step, ::step] == 0)
+        if len(xs):
+            self._renderBlocks(xs * step, ys * step, step)
+
+        if on_update is not None:
+            on_update(self.getImage())
+
+        # Refinement passes
+        while step > 1 and not out_of_time():
+            half = step // 2
+
+            blocks = [(x, y) for priority, x, y in self._getPriorities(step) if quality is None or priority >= quality]
+
+            # Every block gets up to three new samples, so each batch refines about a third as many blocks
+            blocks_per_batch = max(1, self.batch_size // 3)
+
+            for start in range(0, len(blocks), blocks_per_batch):
+                if out_of_time():
+                    break
+
+                batch = blocks[start : start + blocks_per_batch]
+
+                # The three new samples inside each of these blocks
+                xs, ys = [], []
+                for x, y in batch:
+                    for dx, dy in ((half, 0), (0, half), (half, half)):
+                        if x + dx < self.image_width and y + dy < self.image_height:
+                            xs.append(x + dx)
+                            ys.append(y + dy)
+
+                if xs:
+                    self._renderBlocks(xs, ys, half)
+
+                # Each block's own anchor now stands for the smaller block
+                for x, y in batch:
+                    self.level[y : y + half, x : x + half] = np.minimum(
+                        self.level[y : y + half, x : x + half], half
+                    )
+
+            step = half
+
+            if on_update is not None:
+                on_update(self.getImage())
+
+        return self.getImage()
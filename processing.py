@@ -7,10 +7,14 @@ class ToneMapping:
     def luminance(color: np.ndarray):
         return np.dot(color, (0.2126, 0.7152, 0.0722))
 
-    # Adjusts a color to have a desired luminance
+    # Adjusts a color, or every color in an image, to have a desired luminance
     def change_luminance(color: np.ndarray, desired_luminance: float):
-        l_in = ToneMapping.luminance(color)
-        return np.multiply(color, (desired_luminance / l_in))
+        l_in = np.asarray(ToneMapping.luminance(color), dtype=float)
+
+        # Black stays black
+        scale = np.divide(desired_luminance, l_in, out=np.zeros_like(l_in), where=l_in != 0)
+
+        return np.multiply(color, np.expand_dims(scale, -1))
 
     def extendedReinhard(color: np.ndarray):
         color = np.divide(color, 255)
@@ -1,5 +1,6 @@
 import numpy as np
 import math
+from util import as_real
 
 
 class Ray:
@@ -8,12 +9,12 @@ class Ray:
     position = np.ndarray
 
     def __init__(self, velocity: np.ndarray, position: np.ndarray) -> None:
-        self.velocity = self._normalize(velocity)
-        self.position = position
+        self.velocity = self._normalize(as_real(velocity))
+        self.position = as_real(position)
 
     def _normalize(self, array: np.ndarray):
         if np.max(np.abs(array)) == 0:
-            return np.zeros(len(array))
+            return np.zeros(len(array), dtype=array.dtype)
 
         magnitude = math.dist(array, (0, 0, 0))
         normalized_array = np.divide(array, magnitude)
@@ -6,8 +6,6 @@ sys.path.insert(0, os.getcwd())
 # Imports
 import numpy as np
 from PIL import Image
-from tqdm import tqdm
-from ray import Ray
 from scene.scene import Scene
 from scene.materials import BaseMaterial
 from scene.objects.primative import *
@@ -15,7 +13,12 @@ from scene.objects.mesh import *
 from scene.objects.modifier import *
 from scene.lights import PointLight
 from processing import ToneMapping
-from util import get_initial_velocity
+from renderer import render_pixels, render_image, render_views
+from render_cache import RenderCache
+from preview import ProgressiveRenderer
+from path_tracer import PathTracer
+from camera import Camera
+from util import set_precision
 import time
 
 # Constants
@@ -31,56 +34,53 @@ image_width = 32
 image_size = (image_width, image_height)
 
 contrast = 70
-fov = 1
 shading = False
 
-camera_pos = (0, -1.5, -1)
-camera_rotation = (0, 0, 0.5)
+# "float32" halves the memory of rays, scene parameters and meshes, set before anything is built
+precision = "float64"
+set_precision(precision)
+
+# Camera tilted down towards the ground
+camera = Camera((0, -1.5, -1), (0.4636, 0, 0), fov=90)
 
 min_distance = 0.001
 max_distance = 25
 
+# Give up on rays after this many steps, and stop rays once they are closer than a pixel can show.
+# Rays out of steps still count as a hit when they are within a few hit distances of a surface, see `march`
+max_steps = 256
+adaptive_epsilon = True
 
-def hit(scene: Scene, ray: Ray):
-    color = scene.getColor(ray)
-
-    # Tone Mapping
-    color = ToneMapping.extendedReinhard(color)
-
-    return color
-
-
-def miss(scene: Scene, ray: Ray):
-    return (0, 0, 0)
-
-
-def render(x, y, scene):
-    # Get the velocity vector for the ray
-    velocity = get_initial_velocity(
-        x, y, image_width, image_height, fov, camera_rotation
-    )
+# Ambient occlusion: darken creases and contacts with a few SDF samples along each hit's normal.
+# 0 samples turns it off, try 5. Applied to full renders only, not the progressive preview
+occlusion_samples = 0
+occlusion_distance = 0.25
+occlusion_falloff = 0.75
 
-    # Create Ray
-    ray = Ray(velocity, camera_pos)
+# Reuse frames rendered before with exactly the same scene, camera and settings. Tiles are only reused
+# to finish a frame that was interrupted, any change to the scene renders every tile again
+use_cache = True
+render_cache = RenderCache(".render_cache", max_size=256 * 1024 * 1024)
 
-    # This is the real interesting part,
-    # This grabs the distance from the ray to the scene,
-    distance = lambda ray: scene.getSDF(ray)
-    # Then, if that distance is larger than our set minimum distance,
-    d = distance(ray)
-    while (d > min_distance) and (ray.distance_traveled < max_distance):
-        d = distance(ray)
+# Also save the depth, normal, object ID and material ID buffers next to the render
+save_buffers = False
 
-        # we move by that distance.
-        ray.step(d)
+# Progressive preview: render a coarse image first, then refine until the time budget runs out
+progressive = False
+time_budget = 10  # Seconds
+quality = None  # Stop refining blocks that differ from their neighbours by less than this
 
-        if d <= min_distance:
-            return hit(scene, ray)
+# Path tracing: global illumination from random diffuse bounces, sampling each pixel until its
+# relative error is below the threshold, or the time budget above runs out
+path_tracing = False
+convergence_threshold = 0.05
+max_samples = 256
 
-        elif ray.distance_traveled >= max_distance:
-            return miss(scene, ray)
+# Multi-view: render the scene from every camera in this list in one batch, saving renders/view_<n>.png,
+# instead of from the camera above. Resolutions are (width, height) per camera, or None for the image size
+views = []  # e.g. [Camera((1.5, -1.5, -1)), Camera((-1.5, -1.5, -1))], then .lookAt((0, 0, -0.3)) each
+view_resolutions = None
 
-    return miss(scene, ray)
 
 color1 = (77, 32, 21)
 color2 = (177, 103, 57)
@@ -144,45 +144,88 @@ scene = Scene(
     (side_light1,),
     min_distance,
     max_distance,
-    False
+    False,
+    max_steps,
+    adaptive_epsilon,
+    occlusion_samples,
+    occlusion_distance,
+    occlusion_falloff,
 )
 
-# Create Image
-image = Image.new(mode="RGB", size=image_size)
-render_image = image.load()
+# Everything above describes the scene, so the render service can load this file without rendering it
+if __name__ == "__main__":
+    start_time = time.time()
+
+    if progressive:
+        # Every primary ray direction for this resolution, computed once
+        directions = camera.getRayDirections(image_width, image_height)
+
+        preview = ProgressiveRenderer(
+            lambda xs, ys: ToneMapping.extendedReinhard(render_pixels(xs, ys, scene, camera, directions)),
+            image_width,
+            image_height,
+        )
+
+        # Write every pass out, so the render can be watched as it refines
+        image = preview.render(
+            time_budget, quality, lambda image: image.save("renders/render.png", format="png")
+        )
+
+        print(f"Rendered {preview.pixels_rendered} of {image_width * image_height} pixels")
+
+    elif views:
+        for index, (colors, buffers) in enumerate(
+            render_views(scene, views, image_width, image_height, view_resolutions)
+        ):
+            colors = ToneMapping.extendedReinhard(colors)
+            image = Image.fromarray(np.clip(colors, 0, 255).astype(np.uint8), mode="RGB")
+            image.save(f"renders/view_{index}.png", format="png")
+
+        print(f"Rendered {len(views)} views")
 
-# Create Progress Bar
-pbar = tqdm(total=image_width * image_height, unit=" pixels")
-start_time = time.time()
+    elif path_tracing:
+        tracer = PathTracer(scene, camera, image_width, image_height)
 
-for x in range(0, image_width):
-    for y in range(0, image_height):
+        colors = tracer.render(convergence_threshold, time_budget, max_samples=max_samples)
+        tracer.printStatistics(convergence_threshold)
 
-        color = render(x, y, scene)
+        # Tone Mapping
+        colors = ToneMapping.extendedReinhard(colors)
+        image = Image.fromarray(np.clip(colors, 0, 255).astype(np.uint8), mode="RGB")
 
-        r = int(color[0])
-        g = int(color[1])
-        b = int(color[2])
+    else:
+        colors, buffers = render_image(
+            scene,
+            camera,
+            image_width,
+            image_height,
+            cache=render_cache if use_cache else None,
+        )
 
-        render_image[x, y] = (r, g, b)
+        # Tone Mapping
+        colors = ToneMapping.extendedReinhard(colors)
+        image = Image.fromarray(np.clip(colors, 0, 255).astype(np.uint8), mode="RGB")
 
-        # Update Progress Bar by 1
-        pbar.update(1)
+        print(f"Steps per pixel: mean {buffers.steps.mean():.1f}, max {buffers.steps.max()}")
 
-end_time = time.time()
-pbar.close()
-print(f"Rendered in {end_time - start_time:.2f} seconds")
+        if save_buffers:
+            buffers.save("renders/buffers.npz")
+            buffers.saveImages("renders/buffers")
 
-# Save Render
-image.save("renders/render.png", format="png")
+    end_time = time.time()
+    print(f"Rendered in {end_time - start_time:.2f} seconds")
 
+    # Views were saved one file each above, there is no single render to save or display
+    if progressive or not views:
+        # Save Render
+        image.save("renders/render.png", format="png")
 
-# Display
+        # Display
 
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
+        import matplotlib.pyplot as plt
+        import matplotlib.image as mpimg
 
-img = mpimg.imread("renders/render.png")
-plt.imshow(img)
-plt.axis("off")
-plt.show()
+        img = mpimg.imread("renders/render.png")
+        plt.imshow(img)
+        plt.axis("off")
+        plt.show()
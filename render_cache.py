@@ -0,0 +1,183 @@
+import numpy as np
+import hashlib
+import json
+import os
+from scene.objects.mesh_cache import MeshGeometry
+from scene.textures import Texture
+from util import save_atomically
+
+
+# Bump this whenever a change to the renderer changes its output, so old entries stop matching
+RENDER_CACHE_VERSION = 3
+
+# Attributes that are scratch state or derived from other attributes, and never change an image
+_TRANSIENT_ATTRIBUTES = {
+    "distances",
+    "normal",
+    "nearest_object",
+    "analytic_objects",
+    "marched_objects",
+    "materials",
+}
+
+
+def describe(value):
+    """
+    Builds a canonical, JSON serializable description of anything that goes into a render.
+
+    Objects are described by their class and public attributes, so two scenes built
+    the same way describe the same. Meshes and textures are described by their content hash.
+
+    ## Args:
+        `value`: A scene, camera, setting or anything they contain.
+
+    ## Returns:
+        Nested lists, dictionaries and plain values.
+    """
+
+    if isinstance(value, MeshGeometry):
+        return {"mesh": value.key}
+
+    if isinstance(value, Texture):
+        return {"texture": value.key}
+
+    if isinstance(value, np.ndarray):
+        return describe(value.tolist())
+
+    if isinstance(value, np.generic):
+        return describe(value.item())
+
+    if isinstance(value, float):
+        # repr round trips exactly, and keeps 1 and 1.0 apart from each other's ints
+        return repr(value)
+
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+
+    if isinstance(value, (list, tuple)):
+        return [describe(item) for item in value]
+
+    if isinstance(value, dict):
+        return {str(key): describe(item) for key, item in value.items()}
+
+    attributes = {
+        name: describe(attribute)
+        for name, attribute in vars(value).items()
+        if not name.startswith("_") and name not in _TRANSIENT_ATTRIBUTES
+    }
+
+    return {"type": f"{type(value).__module__}.{type(value).__qualname__}", **attributes}
+
+
+class RenderCache:
+    """
+    Stores raw, un-tonemapped render results on disk, addressed by a hash of everything that produced them.
+
+    Entries are evicted least recently used first once the cache grows past `max_size` bytes.
+    """
+
+    def __init__(self, directory: str = ".render_cache", max_size: int = 256 * 1024 * 1024) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def getKey(self, *parts) -> str:
+        """
+        Hashes the canonical description of every input to a render.
+
+        ## Args:
+            `parts`: Scenes, cameras, resolutions, settings and anything else the result depends on.
+
+        ## Returns:
+            A hex digest identifying the result.
+        """
+
+        description = json.dumps(
+            describe((RENDER_CACHE_VERSION,) + parts), sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _getPath(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.npz")
+
+    def get(self, key: str, required=()):
+        """
+        Looks up a cached result.
+
+        ## Args:
+            `key`: A key from `getKey`.
+            `required`: Names of arrays the entry must have, otherwise it counts as a miss.
+
+        ## Returns:
+            A dictionary of the arrays stored under the key, or `None`.
+        """
+
+        path = self._getPath(key)
+
+        try:
+            with np.load(path) as entry:
+                arrays = {name: entry[name] for name in entry.files}
+        except (OSError, ValueError):
+            arrays = None
+
+        if arrays is None or any(name not in arrays for name in required):
+            self.misses += 1
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return arrays
+
+    def put(self, key: str, **arrays):
+        """
+        Stores arrays under a key.
+
+        ## Args:
+            `key`: A key from `getKey`.
+            `arrays`: The arrays to store, by name.
+        """
+
+        path = self._getPath(key)
+
+        try:
+            save_atomically(path, lambda temporary: np.savez(temporary, **arrays))
+        except OSError:
+            # The cache is only an optimization
+            pass
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache fits in `max_size`."""
+
+        entries = []
+
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum(entry[1] for entry in entries)
+
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+            size -= entry_size
+
+    def resetStatistics(self):
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,501 @@
+import numpy as np
+import time
+from tqdm import tqdm
+from scene.scene import Scene
+from camera import Camera
+from render_cache import RenderCache
+from buffers import RenderBuffers
+from util import get_dtype
+
+# Rays out of steps within this many hit distances of a surface are most likely grazing it, and count as a hit
+GRAZING_HIT_FACTOR = 4
+
+
+def render_rays(scene: Scene, origins, directions, pixel_angle=0.0) -> dict:
+    """
+    Marches rays into the scene, and works out everything about where they hit but their material colors.
+
+    ## Args:
+        `scene`: The scene to render.
+        `origins`: An (N, 3) array of ray starting points.
+        `directions`: An (N, 3) array of normalized ray directions.
+        `pixel_angle`: Angular size of a pixel, for the adaptive hit distance and material filtering,
+            one for all rays or one per ray.
+
+    ## Returns:
+        (N, ...) arrays by buffer name, see `RenderBuffers`: steps, depth, normal, object ID, material ID
+        and irradiance. Rays that missed get an infinite depth, zero normal and irradiance, and IDs of -1.
+    """
+
+    count = len(origins)
+    traveled, hits, steps = march(scene, origins, directions, pixel_angle)
+
+    arrays = {
+        "steps": steps,
+        "depth": np.full(count, np.inf, dtype=np.float32),
+        "normal": np.zeros((count, 3), dtype=np.float32),
+        "object_id": np.full(count, -1, dtype=np.int32),
+        "material_id": np.full(count, -1, dtype=np.int32),
+        "irradiance": np.zeros((count, 3), dtype=np.float32),
+    }
+
+    if not hits.any():
+        return arrays
+
+    depth = traveled[hits]
+    positions = origins[hits] + directions[hits] * depth[:, np.newaxis]
+
+    # Shading needs to know which object is nearest to every hit
+    indices = scene.getNearestObjectIndices(positions)
+    normals = scene.getNormals(positions, indices)
+
+    arrays["depth"][hits] = depth
+    arrays["normal"][hits] = normals
+    arrays["object_id"][hits] = indices
+    arrays["material_id"][hits] = scene.getMaterialIds(positions, indices)
+    arrays["irradiance"][hits] = scene.getLightings(positions, normals)
+
+    return arrays
+
+
+def render_region(scene: Scene, camera: Camera, directions, buffers: RenderBuffers, region=np.s_[:, :]):
+    """
+    Renders every pixel in a region of the image in one batch, into deferred buffers.
+
+    ## Args:
+        `scene`: The scene to render.
+        `camera`: The camera to render from.
+        `directions`: The primary ray directions, see `Camera.getRayDirections`.
+        `buffers`: Buffers to write the pixels into, see `render_rays`.
+        `region`: Only render this (rows, columns) slice of the image.
+    """
+
+    region_directions = directions[region]
+    shape = region_directions.shape[:2]
+
+    rays = region_directions.reshape(-1, 3)
+    origins = np.broadcast_to(camera.getPosition(), rays.shape).astype(rays.dtype)
+
+    arrays = render_rays(scene, origins, rays, camera.getPixelAngle(directions.shape[1]))
+    buffers.setArrays({name: array.reshape(shape + array.shape[1:]) for name, array in arrays.items()}, region)
+
+
+def render_pixels(xs, ys, scene: Scene, camera: Camera, directions, buffers: RenderBuffers = None):
+    """
+    Renders scattered pixels in one batch, for renderers that pick which pixels to render.
+
+    ## Args:
+        `xs`: An (N,) array of pixel columns.
+        `ys`: An (N,) array of pixel rows.
+        `scene`: The scene to render.
+        `camera`: The camera to render from.
+        `directions`: The primary ray directions, see `Camera.getRayDirections`.
+        `buffers`: Also write the pixels into these buffers.
+
+    ## Returns:
+        An (N, 3) array of the pixels' HDR colors, without ambient occlusion and black wherever a ray missed.
+    """
+
+    rays = directions[ys, xs]
+    origins = np.broadcast_to(camera.getPosition(), rays.shape).astype(rays.dtype)
+    pixel_angle = camera.getPixelAngle(directions.shape[1])
+
+    arrays = render_rays(scene, origins, rays, pixel_angle)
+
+    if buffers is not None:
+        buffers.setArrays(arrays, (ys, xs))
+
+    colors = np.zeros((len(rays), 3))
+    hit = np.isfinite(arrays["depth"])
+    if not hit.any():
+        return colors
+
+    # Colors stay in HDR here, tone mapping happens once the whole image is done
+    depth = arrays["depth"][hit]
+    positions = origins[hit] + rays[hit] * depth[:, np.newaxis].astype(rays.dtype)
+    colors[hit] = shade_hits(
+        scene,
+        positions,
+        arrays["normal"][hit],
+        depth * pixel_angle,
+        arrays["material_id"][hit],
+        arrays["irradiance"][hit],
+    )
+    return colors
+
+
+def march(scene: Scene, origins, directions, pixel_angle: float = 0.0, max_distance=None):
+    """
+    Marches many rays through the scene at once.
+
+    Every step evaluates the scene for all rays still travelling in one batch,
+    and rays drop out of the batch as soon as they hit or miss.
+
+    ## Args:
+        `scene`: The scene to march through.
+        `origins`: An (N, 3) array of ray starting points.
+        `directions`: An (N, 3) array of normalized ray directions.
+        `pixel_angle`: Angular size of a pixel, for the adaptive hit distance, one for all rays or one per ray.
+            0 for rays that don't start at the camera.
+        `max_distance`: How far rays go before they count as a miss, one for all rays or one per ray.
+            Defaults to the scene's `max_distance`.
+
+    ## Returns:
+        (N,) arrays of how far every ray got, whether it hit something, and how many steps it took.
+        Rays that run out of steps count as a hit if they are within `GRAZING_HIT_FACTOR` hit distances
+        of a surface, and as a miss otherwise.
+    """
+
+    count = len(origins)
+
+    if max_distance is None:
+        max_distance = scene.max_distance
+    max_distance = np.broadcast_to(max_distance, (count,))
+    pixel_angle = np.broadcast_to(pixel_angle, (count,))
+
+    # Objects with a closed form intersection are hit exactly, the rest are marched up to that hit
+    limit = np.minimum(scene.getIntersections(origins, directions), max_distance)
+
+    traveled = np.zeros(count, dtype=origins.dtype)
+    steps = np.zeros(count, dtype=np.int32)
+    hits = np.zeros(count, dtype=bool)
+
+    active = np.arange(count)
+
+    while len(active):
+        positions = origins[active] + directions[active] * traveled[active, np.newaxis]
+        d = scene.getMarchSDFs(positions)
+        hit_distances = scene.getHitDistances(positions, traveled[active], pixel_angle[active])
+
+        # Close enough to count as a hit, or out of steps, which is only a hit when still close to a surface
+        hit = d <= hit_distances
+        out_of_steps = ~hit & (steps[active] >= scene.max_steps)
+        done = hit | out_of_steps
+        hits[active[hit | (out_of_steps & (d <= hit_distances * GRAZING_HIT_FACTOR))]] = True
+
+        # Nothing marched is closer than the analytic hit, so jump straight to it
+        jump = ~done & (d >= limit[active] - traveled[active])
+        jumped = active[jump]
+        traveled[jumped] = limit[jumped]
+        steps[jumped] += 1
+        hits[jumped] = limit[jumped] < max_distance[jumped]
+
+        # Everything else moves on by its distance, until it has gone too far
+        stepped = active[~done & ~jump]
+        traveled[stepped] += d[~done & ~jump]
+        steps[stepped] += 1
+
+        active = stepped[traveled[stepped] < max_distance[stepped]]
+
+    return traveled, hits, steps
+
+
+def get_hit_points(camera: Camera, directions, buffers: RenderBuffers, region=np.s_[:, :]):
+    """
+    Rebuilds where every primary ray hit from how far it got.
+
+    ## Args:
+        `camera`: The camera the image was rendered from.
+        `directions`: The primary ray directions, see `Camera.getRayDirections`.
+        `buffers`: Auxiliary buffers of the render.
+        `region`: Only work on this (rows, columns) slice of the image.
+
+    ## Returns:
+        A (rows, columns) mask of the pixels that hit, and (hits, 3) arrays of their positions and normals.
+    """
+
+    depth = buffers.depth[region]
+    hit = np.isfinite(depth)
+
+    dtype = get_dtype()
+    positions = camera.getPosition() + directions[region][hit] * depth[hit][:, np.newaxis].astype(dtype)
+    normals = buffers.normal[region][hit].astype(dtype)
+
+    return hit, positions, normals
+
+
+def shade_materials(scene: Scene, camera: Camera, directions, buffers: RenderBuffers, region=np.s_[:, :]):
+    """
+    Works out the color of every hit pixel from deferred buffers, one batch per material.
+
+    ## Args:
+        `scene`: The scene that was rendered.
+        `camera`: The camera it was rendered from.
+        `directions`: The primary ray directions, see `Camera.getRayDirections`.
+        `buffers`: Deferred buffers of the render.
+        `region`: Only work on this (rows, columns) slice of the image.
+
+    ## Returns:
+        A (rows, columns, 3) array of HDR colors, black wherever a ray missed.
+    """
+
+    hit, positions, normals = get_hit_points(camera, directions, buffers, region)
+
+    colors = np.zeros(hit.shape + (3,))
+    if not hit.any():
+        return colors
+
+    # How wide a pixel is where it hits, so materials can filter detail smaller than that
+    footprints = buffers.depth[region][hit] * camera.getPixelAngle(directions.shape[1])
+
+    colors[hit] = shade_hits(
+        scene, positions, normals, footprints, buffers.material_id[region][hit], buffers.irradiance[region][hit]
+    )
+    return colors
+
+
+def shade_hits(scene: Scene, positions, normals, footprints, material_ids, irradiance):
+    """
+    Works out the color of many hit points, one batch per material.
+
+    ## Args:
+        `scene`: The scene that was rendered.
+        `positions`: An (N, 3) array of hit points.
+        `normals`: An (N, 3) array of the normals at those points.
+        `footprints`: An (N,) array of how wide a pixel is at each point.
+        `material_ids`: An (N,) array of the material at each point, see `Scene.getMaterialIds`.
+        `irradiance`: An (N, 3) array of the light reaching each point, see `Scene.getLightings`.
+
+    ## Returns:
+        An (N, 3) array of HDR colors.
+    """
+
+    albedo = np.zeros((len(positions), 3))
+
+    for material_id in np.unique(material_ids):
+        if material_id < 0:
+            continue
+
+        mask = material_ids == material_id
+        albedo[mask] = scene.materials[material_id].getColor(
+            positions[mask], normals[mask], footprints[mask]
+        )
+
+    return scene.getAmbient() + albedo * irradiance
+
+
+def ambient_occlusion(scene: Scene, camera: Camera, directions, buffers: RenderBuffers, region=np.s_[:, :]):
+    """
+    Works out the ambient occlusion of every hit pixel in one batch, from the depth and normal buffers.
+
+    ## Args:
+        `scene`: The scene that was rendered.
+        `camera`: The camera it was rendered from.
+        `directions`: The primary ray directions, see `Camera.getRayDirections`.
+        `buffers`: Auxiliary buffers of the render.
+        `region`: Only work on this (rows, columns) slice of the image.
+
+    ## Returns:
+        A (rows, columns) array to multiply the colors by, 1 wherever a ray missed.
+    """
+
+    hit, positions, normals = get_hit_points(camera, directions, buffers, region)
+    occlusion = np.ones(hit.shape)
+
+    if scene.occlusion_samples <= 0 or not hit.any():
+        return occlusion
+
+    occlusion[hit] = scene.getAmbientOcclusion(positions, normals)
+    return occlusion
+
+
+def render_image(
+    scene: Scene,
+    camera: Camera,
+    image_width: int,
+    image_height: int,
+    progress: bool = True,
+    cache: RenderCache = None,
+    tile_size: int = 64,
+):
+    """
+    Renders every pixel of an image, tile by tile.
+
+    Each tile's pixels are marched and lit in one batch, see `render_region`. Materials and ambient occlusion are
+    then worked out over the whole frame at once, from the buffers the tiles wrote.
+
+    ## Args:
+        `scene`: The scene to render.
+        `camera`: The camera to render from.
+        `image_width`: Width of the image in pixels.
+        `image_height`: Height of the image in pixels.
+        `progress`: Show a progress bar.
+        `cache`: Reuse the frame, or any tiles, rendered before with the exact same inputs. Tiles are keyed
+            on the whole frame's inputs, as shadows let any object or light change any pixel, so any change
+            to the scene misses every tile. They only help finish a frame that was interrupted or evicted.
+        `tile_size`: Width and height of the tiles the image is rendered and cached in.
+
+    ## Returns:
+        A (height, width, 3) array of HDR colors and the `RenderBuffers` written along with them,
+        including depth, normal, object ID and material ID.
+    """
+
+    buffers = RenderBuffers(image_width, image_height, deferred=True)
+
+    if cache is not None:
+        frame_key = cache.getKey(scene, camera, image_width, image_height, get_dtype().__name__)
+        required = list(buffers.getArrays())
+
+        frame = cache.get(frame_key, ["colors", *required])
+
+        if frame is not None:
+            if progress:
+                print("Render cache: frame hit")
+            buffers.setArrays(frame)
+            return frame["colors"], buffers
+
+        # Only count the tiles from here on
+        cache.resetStatistics()
+
+    # Every primary ray direction for this resolution, computed once
+    directions = camera.getRayDirections(image_width, image_height)
+
+    # Create Progress Bar
+    pbar = tqdm(total=image_width * image_height, unit=" pixels", disable=not progress)
+
+    for tile_x in range(0, image_width, tile_size):
+        for tile_y in range(0, image_height, tile_size):
+            tile = (
+                slice(tile_y, min(tile_y + tile_size, image_height)),
+                slice(tile_x, min(tile_x + tile_size, image_width)),
+            )
+            tile_pixels = buffers.steps[tile].size
+
+            if cache is not None:
+                # Keyed on the whole frame, see `cache` above
+                tile_key = cache.getKey(frame_key, tile_x, tile_y, tile_size)
+                cached = cache.get(tile_key, required)
+
+                if cached is not None:
+                    buffers.setArrays(cached, tile)
+                    pbar.update(tile_pixels)
+                    continue
+
+            render_region(scene, camera, directions, buffers, tile)
+
+            if cache is not None:
+                cache.put(tile_key, **buffers.getArrays(tile))
+
+            # Update Progress Bar by the whole tile
+            pbar.update(tile_pixels)
+
+    pbar.close()
+
+    hits = np.isfinite(buffers.depth).sum()
+
+    start_time = time.time()
+    colors = shade_materials(scene, camera, directions, buffers)
+
+    if progress:
+        print(
+            f"Materials: {hits} hit points, {len(np.unique(buffers.material_id[buffers.material_id >= 0]))} "
+            f"materials, {time.time() - start_time:.3f} seconds"
+        )
+
+    if scene.occlusion_samples > 0:
+        start_time = time.time()
+        colors *= ambient_occlusion(scene, camera, directions, buffers)[:, :, np.newaxis]
+
+        if progress:
+            print(
+                f"Ambient occlusion: {hits} hit points, "
+                f"{scene.occlusion_samples} samples, {time.time() - start_time:.3f} seconds"
+            )
+
+    if cache is not None:
+        cache.put(frame_key, colors=colors, **buffers.getArrays())
+        cache.evict()
+
+        if progress:
+            print(f"Render cache: {cache.hits} tile hits, {cache.misses} tile misses")
+
+    return colors, buffers
+
+
+def render_views(
+    scene: Scene,
+    cameras,
+    image_width: int,
+    image_height: int,
+    resolutions=None,
+    progress: bool = True,
+    batch_size: int = 65536,
+):
+    """
+    Renders one scene from many cameras at once.
+
+    The scene, its meshes and any distance cache are shared by every view. All views'
+    primary rays are put in one list and marched and lit in batches, so every batch
+    stays full however many pixels any one view has left. Materials and ambient
+    occlusion are then worked out per view, the same way `render_image` does.
+
+    ## Args:
+        `scene`: The scene to render.
+        `cameras`: The cameras to render from, one image each.
+        `image_width`: Width of every image in pixels.
+        `image_height`: Height of every image in pixels.
+        `resolutions`: (width, height) per camera, instead of `image_width` and `image_height`.
+        `progress`: Show a progress bar.
+        `batch_size`: How many rays are marched together. Larger batches take more memory.
+
+    ## Returns:
+        A list with, per camera, a (height, width, 3) array of HDR colors and the `RenderBuffers`
+        written along with them, including depth, normal, object ID and material ID.
+    """
+
+    if resolutions is None:
+        resolutions = [(image_width, image_height)] * len(cameras)
+
+    # Every view's primary rays, one after the other
+    view_directions = [
+        camera.getRayDirections(width, height) for camera, (width, height) in zip(cameras, resolutions)
+    ]
+    pixels = [width * height for width, height in resolutions]
+
+    directions = np.concatenate([rays.reshape(-1, 3) for rays in view_directions])
+    origins = np.concatenate(
+        [np.broadcast_to(camera.getPosition(), (count, 3)) for camera, count in zip(cameras, pixels)]
+    ).astype(directions.dtype)
+    pixel_angles = np.repeat(
+        [camera.getPixelAngle(width) for camera, (width, _) in zip(cameras, resolutions)], pixels
+    )
+
+    count = len(origins)
+    arrays = {}
+
+    # Create Progress Bar
+    pbar = tqdm(total=count, unit=" pixels", disable=not progress)
+
+    for start in range(0, count, batch_size):
+        batch = np.s_[start : start + batch_size]
+        batch_arrays = render_rays(scene, origins[batch], directions[batch], pixel_angles[batch])
+
+        for name, array in batch_arrays.items():
+            if name not in arrays:
+                arrays[name] = np.empty((count,) + array.shape[1:], dtype=array.dtype)
+            arrays[name][batch] = array
+
+        pbar.update(len(batch_arrays["steps"]))
+
+    pbar.close()
+
+    # Split everything back up into views
+    views = []
+    start = 0
+    for camera, rays, (width, height) in zip(cameras, view_directions, resolutions):
+        view = np.s_[start : start + width * height]
+        start += width * height
+
+        buffers = RenderBuffers(width, height, deferred=True)
+        buffers.setArrays(
+            {name: array[view].reshape((height, width) + array.shape[1:]) for name, array in arrays.items()}
+        )
+
+        colors = shade_materials(scene, camera, rays, buffers)
+
+        if scene.occlusion_samples > 0:
+            colors *= ambient_occlusion(scene, camera, rays, buffers)[:, :, np.newaxis]
+
+        views.append((colors, buffers))
+
+    return views
@@ -1,6 +1,6 @@
 from ray import Ray
 import numpy as np
-from util import normalize
+from util import normalize, as_real
 
 
 class SceneLight:
@@ -23,7 +23,7 @@ class SceneLight:
 
 class PointLight:
     def __init__(self, pos: np.ndarray, intensity: float, color: np.ndarray) -> None:
-        self.pos = pos
+        self.pos = as_real(pos)
         self.intensity = intensity
         self.color = color
 
@@ -1,14 +1,154 @@
+import numpy as np
+from scene.textures import Texture, get_noise, load_texture
+
+
 class Material:
     def __init__(self) -> None:
         pass
 
-    def getColor(self):
-        return (0, 0, 0)
+    def getColor(self, positions: np.ndarray = None, normals: np.ndarray = None, footprints: np.ndarray = None):
+        """
+        Calculates the material's color at a batch of surface points.
+
+        ## Args:
+            `positions`: An (N, 3) array of hit points, or `None` for one color for the whole material.
+            `normals`: An (N, 3) array of the surface normals at those points.
+            `footprints`: An (N,) array of how wide a pixel is at each point, so patterns can be filtered.
+
+        ## Returns:
+            An (N, 3) array of 0 - 255 colors, or a single color without `positions`.
+        """
+
+        return self._fill((0, 0, 0), positions)
+
+    def _fill(self, color, positions):
+        if positions is None:
+            return color
+
+        return np.tile(np.asarray(color, dtype=float), (len(positions), 1))
 
 
 class BaseMaterial(Material):
     def __init__(self, color) -> None:
         self.color = color
 
-    def getColor(self):
-        return self.color
+    def getColor(self, positions: np.ndarray = None, normals: np.ndarray = None, footprints: np.ndarray = None):
+        return self._fill(self.color, positions)
+
+
+class CheckerMaterial(Material):
+    """Alternates between two colors in a 3D checkerboard of cubes with side length `size`"""
+
+    def __init__(self, color1, color2, size: float = 0.25) -> None:
+        self.color1 = color1
+        self.color2 = color2
+        self.size = size
+
+    def getColor(self, positions: np.ndarray = None, normals: np.ndarray = None, footprints: np.ndarray = None):
+        average = np.add(self.color1, self.color2) / 2
+
+        if positions is None:
+            return average
+
+        cells = np.floor(positions / self.size).astype(np.int64).sum(axis=1) & 1
+        colors = np.where(cells[:, np.newaxis] == 0, self.color1, self.color2).astype(float)
+
+        if footprints is not None:
+            # Where a pixel covers a whole cell or more, it would see the average anyway
+            blend = np.clip(footprints / self.size * 2 - 1, 0, 1)[:, np.newaxis]
+            colors += (average - colors) * blend
+
+        return colors
+
+
+class GradientMaterial(Material):
+    """Blends linearly from `color1` at position `start` to `color2` at position `end`"""
+
+    def __init__(self, color1, color2, start: np.ndarray, end: np.ndarray) -> None:
+        self.color1 = color1
+        self.color2 = color2
+        self.start = np.asarray(start, dtype=float)
+        self.end = np.asarray(end, dtype=float)
+
+    def getColor(self, positions: np.ndarray = None, normals: np.ndarray = None, footprints: np.ndarray = None):
+        if positions is None:
+            return np.add(self.color1, self.color2) / 2
+
+        direction = self.end - self.start
+        t = np.clip((positions - self.start) @ direction / np.dot(direction, direction), 0, 1)
+
+        return np.add(self.color1, np.multiply.outer(t, np.subtract(self.color2, self.color1)))
+
+
+class NoiseMaterial(Material):
+    """Blends between two colors by fractal gradient noise, with features about `scale` across"""
+
+    def __init__(
+        self,
+        color1,
+        color2,
+        scale: float = 0.5,
+        octaves: int = 4,
+        lacunarity: float = 2.0,
+        gain: float = 0.5,
+        seed: int = 0,
+    ) -> None:
+        self.color1 = color1
+        self.color2 = color2
+        self.scale = scale
+        self.octaves = octaves
+        self.lacunarity = lacunarity
+        self.gain = gain
+        self.seed = seed
+
+        # The lattice tables are shared by every material with the same seed
+        self._noise = get_noise(seed)
+
+    def getColor(self, positions: np.ndarray = None, normals: np.ndarray = None, footprints: np.ndarray = None):
+        if positions is None:
+            return np.add(self.color1, self.color2) / 2
+
+        if footprints is not None:
+            footprints = footprints / self.scale
+
+        value = self._noise.getFBM(
+            positions / self.scale, self.octaves, self.lacunarity, self.gain, footprints
+        )
+        t = np.clip(value * 0.5 + 0.5, 0, 1)
+
+        return np.add(self.color1, np.multiply.outer(t, np.subtract(self.color2, self.color1)))
+
+
+class ImageMaterial(Material):
+    """
+    Projects an image onto a surface along all three axes (triplanar mapping).
+
+    Each projection is weighted by how squarely the surface faces its axis, so
+    the image wraps any shape without needing texture coordinates.
+    """
+
+    def __init__(self, file_name: str, scale: float = 1.0, sharpness: float = 4.0) -> None:
+        self.file_name = file_name
+        self.scale = scale
+        self.sharpness = sharpness
+
+        # Shared with every material using the same file, with its mip levels
+        self.texture: Texture = load_texture(file_name)
+
+    def getColor(self, positions: np.ndarray = None, normals: np.ndarray = None, footprints: np.ndarray = None):
+        if positions is None:
+            return self.texture.levels[-1][0, 0].astype(float)
+
+        weights = np.abs(normals) ** self.sharpness
+        weights /= np.maximum(weights.sum(axis=1, keepdims=True), 1e-12)
+
+        uv = positions / self.scale
+        if footprints is not None:
+            footprints = footprints / self.scale
+
+        # Project onto the plane facing each axis
+        colors = np.zeros((len(positions), 3))
+        for axis, plane in enumerate(((1, 2), (0, 2), (0, 1))):
+            colors += weights[:, axis, np.newaxis] * self.texture.sample(uv[:, plane], footprints)
+
+        return colors
@@ -0,0 +1,274 @@
+import numpy as np
+import hashlib
+import math
+import os
+import trimesh
+from util import get_dtype, save_atomically
+
+
+# Distances are found for as many points at once as keeps (points, faces) arrays at about this many elements
+chunk_elements = 1 << 14
+
+# Parsed meshes are written here, so later runs can memory-map them instead of parsing again
+cache_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", ".mesh_cache")
+
+
+class MeshGeometry:
+    """
+    Defines the shared, untransformed geometry of a mesh file.
+
+    Every `MeshObject` made from the same file content uses the same instance,
+    so vertices, faces and anything precomputed from them exist only once.
+    Vertex data is stored in the precision that was current when it was loaded.
+    """
+
+    def __init__(self, key: str, vertices: np.ndarray, faces: np.ndarray) -> None:
+        self.key = key
+        self.vertices = np.asarray(vertices, dtype=get_dtype())
+        self.faces = faces
+
+        # Axis aligned bounds, used to skip the per-face search far from the mesh
+        self.bounds = np.array((vertices.min(axis=0), vertices.max(axis=0)))
+        self.center = self.bounds.mean(axis=0)
+        self.half_size = (self.bounds[1] - self.bounds[0]) / 2
+
+        # Corners of every triangle, as one (faces, 3, 3) array
+        self.triangles = np.ascontiguousarray(self.vertices[faces])
+
+        self._computePseudonormals()
+
+        if not self.watertight:
+            print(
+                f"Mesh {key[:12]} is not watertight, it will be rendered as a thin shell without an inside."
+            )
+
+    def _computePseudonormals(self):
+        """
+        Precomputes the angle-weighted pseudonormals of every face, edge and vertex.
+
+        The sign of a point's distance to a closed mesh is the sign of the dot product
+        between the offset to its closest point and the pseudonormal of the feature
+        (face, edge or vertex) that closest point lies on.
+        """
+
+        a, b, c = self.triangles[:, 0], self.triangles[:, 1], self.triangles[:, 2]
+
+        face_normals = np.cross(b - a, c - a)
+        lengths = np.linalg.norm(face_normals, axis=1, keepdims=True)
+        self.face_normals = np.divide(
+            face_normals, lengths, out=np.zeros_like(face_normals), where=lengths > 0
+        )
+
+        # Vertices: face normals weighted by the triangle's angle at that vertex
+        vertex_normals = np.zeros((len(self.vertices), 3), dtype=self.vertices.dtype)
+        for corner in range(3):
+            u = self.triangles[:, (corner + 1) % 3] - self.triangles[:, corner]
+            v = self.triangles[:, (corner + 2) % 3] - self.triangles[:, corner]
+
+            cosine = np.einsum("ij,ij->i", u, v) / np.maximum(
+                np.linalg.norm(u, axis=1) * np.linalg.norm(v, axis=1), 1e-30
+            )
+            angle = np.arccos(np.clip(cosine, -1, 1))
+
+            np.add.at(vertex_normals, self.faces[:, corner], self.face_normals * angle[:, np.newaxis])
+
+        # Edges: both neighbouring faces weigh the same, so the pseudonormal is their sum
+        directed_edges = np.concatenate(
+            [self.faces[:, (0, 1)], self.faces[:, (1, 2)], self.faces[:, (2, 0)]]
+        )
+        edges, edge_index, edge_count = np.unique(
+            np.sort(directed_edges, axis=1), axis=0, return_inverse=True, return_counts=True
+        )
+        edge_index = edge_index.reshape(-1)
+
+        edge_normals = np.zeros((len(edges), 3), dtype=self.vertices.dtype)
+        np.add.at(edge_normals, edge_index, np.tile(self.face_normals, (3, 1)))
+
+        # Pseudonormal of every feature of every face, as a (faces, 7, 3) array in the order of
+        # `getDistances`' features: the face, its edges ab, bc and ca, and its vertices a, b and c
+        self.feature_normals = np.concatenate(
+            (
+                self.face_normals[:, np.newaxis],
+                edge_normals[edge_index].reshape(3, -1, 3).transpose(1, 0, 2),
+                vertex_normals[self.faces],
+            ),
+            axis=1,
+        )
+
+        # A closed, consistently wound mesh uses every edge exactly twice, once in each direction
+        self.watertight = bool(
+            np.all(edge_count == 2)
+            and len(np.unique(directed_edges, axis=0)) == len(directed_edges)
+        )
+
+    def getBoundsDistances(self, points: np.ndarray) -> np.ndarray:
+        """
+        Calculates the distance from many points to the mesh's bounding box.
+
+        ## Args:
+            `points`: An (N, 3) array of points in the mesh's local space.
+
+        ## Returns:
+            An (N,) array of distances to the box, 0 inside it. Never larger than the distance to the mesh.
+        """
+
+        q = np.abs(points - self.center) - self.half_size
+        return np.linalg.norm(np.maximum(q, 0), axis=1)
+
+    def getDistances(self, points: np.ndarray) -> np.ndarray:
+        """
+        Calculates the distance from many points to the mesh's surface.
+
+        Every point is tested against every triangle, a chunk of points at a time to bound the memory used.
+
+        ## Args:
+            `points`: An (N, 3) array of points in the mesh's local space.
+
+        ## Returns:
+            An (N,) array of distances to the closest triangle, negative inside a watertight mesh.
+        """
+
+        distances = np.empty(len(points), dtype=self.vertices.dtype)
+        rows = max(1, chunk_elements // len(self.faces))
+
+        for start in range(0, len(points), rows):
+            distances[start : start + rows] = self._getChunkDistances(points[start : start + rows])
+
+        return distances
+
+    def _getChunkDistances(self, p: np.ndarray) -> np.ndarray:
+        a = self.triangles[:, 0]
+        ab = self.triangles[:, 1] - a
+        ac = self.triangles[:, 2] - a
+
+        # Closest point on every triangle to every point, following Ericson's region tests
+        ap = p[:, np.newaxis] - a
+        bp = ap - ab
+        cp = ap - ac
+        d1 = np.einsum("fk,pfk->pf", ab, ap)
+        d2 = np.einsum("fk,pfk->pf", ac, ap)
+        d3 = np.einsum("fk,pfk->pf", ab, bp)
+        d4 = np.einsum("fk,pfk->pf", ac, bp)
+        d5 = np.einsum("fk,pfk->pf", ab, cp)
+        d6 = np.einsum("fk,pfk->pf", ac, cp)
+
+        va = d3 * d6 - d5 * d4
+        vb = d5 * d2 - d1 * d6
+        vc = d1 * d4 - d3 * d2
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_ab = d1 / (d1 - d3)
+            t_ac = d2 / (d2 - d6)
+            t_bc = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+
+            denominator = va + vb + vc
+            v = vb / denominator
+            w = vc / denominator
+
+        # Features: 0 face, 1 edge ab, 2 edge bc, 3 edge ca, 4 vertex a, 5 vertex b, 6 vertex c
+        regions = (
+            (d1 <= 0) & (d2 <= 0),
+            (d3 >= 0) & (d4 <= d3),
+            (vc <= 0) & (d1 >= 0) & (d3 <= 0),
+            (d6 >= 0) & (d5 <= d6),
+            (vb <= 0) & (d2 >= 0) & (d6 <= 0),
+            (va <= 0) & ((d4 - d3) >= 0) & ((d5 - d6) >= 0),
+        )
+        feature = np.select(regions, (4, 5, 1, 6, 3, 2), 0)
+
+        # Every closest point as a + v * ab + w * ac
+        v = np.select(regions, (0, 1, t_ab, 0, 0, 1 - t_bc), v)
+        w = np.select(regions, (0, 0, 0, 1, t_ac, t_bc), w)
+
+        offsets = ap - ab * v[..., np.newaxis] - ac * w[..., np.newaxis]
+        squared_distances = np.einsum("pfk,pfk->pf", offsets, offsets)
+
+        rows = np.arange(len(p))
+        nearest = np.nanargmin(squared_distances, axis=1)
+        distances = np.sqrt(squared_distances[rows, nearest])
+
+        if not self.watertight:
+            return distances
+
+        # Inside where the offset to the closest point points against the pseudonormal of its feature
+        pseudonormals = self.feature_normals[nearest, feature[rows, nearest]]
+        inside = np.einsum("ij,ij->i", offsets[rows, nearest], pseudonormals) < 0
+
+        return np.where(inside, -distances, distances)
+
+
+# Geometry loaded by this process, by content hash and precision
+_geometries = {}
+
+# Content hash of every file seen, by (path, modification time, size), so unchanged files are only hashed once
+_file_hashes = {}
+
+
+def _hash_file(file_name: str) -> str:
+    path = os.path.abspath(file_name)
+    stat = os.stat(path)
+    file_key = (path, stat.st_mtime_ns, stat.st_size)
+
+    if file_key not in _file_hashes:
+        with open(path, "rb") as file:
+            _file_hashes[file_key] = hashlib.sha256(file.read()).hexdigest()
+
+    return _file_hashes[file_key]
+
+
+def _load_cached(key: str):
+    directory = os.path.join(cache_directory, key)
+
+    try:
+        vertices = np.load(os.path.join(directory, "vertices.npy"), mmap_mode="r")
+        faces = np.load(os.path.join(directory, "faces.npy"), mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+
+    return vertices, faces
+
+
+def _save_cached(key: str, vertices: np.ndarray, faces: np.ndarray):
+    directory = os.path.join(cache_directory, key)
+
+    try:
+        for name, array in (("vertices", vertices), ("faces", faces)):
+            # Another process may be mapping these files already
+            save_atomically(os.path.join(directory, f"{name}.npy"), lambda path: np.save(path, array))
+    except OSError:
+        # The disk cache is only an optimization
+        pass
+
+
+def load_geometry(file_name: str) -> MeshGeometry:
+    """
+    Loads a mesh file, reusing geometry already loaded by this process or cached on disk.
+
+    ## Args:
+        `file_name`: Path to any mesh file trimesh can read.
+
+    ## Returns:
+        The shared geometry for the file's content.
+    """
+
+    key = _hash_file(file_name)
+
+    if (key, get_dtype()) in _geometries:
+        return _geometries[(key, get_dtype())]
+
+    cached = _load_cached(key)
+
+    if cached is None:
+        mesh: trimesh.Trimesh = trimesh.load(file_name, force="mesh")
+
+        vertices = np.ascontiguousarray(mesh.vertices, dtype=np.float64)
+        faces = np.ascontiguousarray(mesh.faces, dtype=np.int32)
+
+        _save_cached(key, vertices, faces)
+    else:
+        vertices, faces = cached
+
+    geometry = MeshGeometry(key, vertices, faces)
+    _geometries[(key, get_dtype())] = geometry
+
+    return geometry
@@ -1,6 +1,34 @@
 from ray import Ray
 import numpy as np
 from scene.objects.scene_object import SceneObject
+from util import as_real
+
+
+def _combine_colors(object1, object2, nearest, positions, normals, footprints):
+    """Colors points `nearest` marks by `object1`'s material, and the rest by `object2`'s."""
+
+    colors = np.empty((len(positions), 3))
+
+    for object, mask in ((object1, nearest), (object2, ~nearest)):
+        if mask.any():
+            colors[mask] = object.getMaterialColors(
+                positions[mask], normals[mask], None if footprints is None else footprints[mask]
+            )
+
+    return colors
+
+
+def _combine_ids(object1, object2, nearest, positions, material_id):
+    """Numbers points `nearest` marks by `object1`'s material, and the rest by `object2`'s."""
+
+    ids = np.empty(len(positions), dtype=np.int32)
+
+    for object, mask in ((object1, nearest), (object2, ~nearest)):
+        if mask.any():
+            ids[mask] = object.getMaterialIds(positions[mask], material_id)
+
+    return ids
+
 
 class UnionObject(SceneObject):
 
@@ -20,6 +48,20 @@ class UnionObject(SceneObject):
 
         return min(distances)
 
+    def getSDFs(self, positions: np.ndarray) -> np.ndarray:
+        return np.minimum(self.object1.getSDFs(positions), self.object2.getSDFs(positions))
+
+    def _getNearest(self, positions: np.ndarray) -> np.ndarray:
+        # The same child `getSDF` picks, for every point at once
+        return self.object1.getSDFs(positions) <= self.object2.getSDFs(positions)
+
+    def getMaterialColors(self, positions: np.ndarray, normals: np.ndarray, footprints: np.ndarray = None) -> np.ndarray:
+        nearest = self._getNearest(positions)
+        return _combine_colors(self.object1, self.object2, nearest, positions, normals, footprints)
+
+    def getMaterialIds(self, positions: np.ndarray, material_id) -> np.ndarray:
+        return _combine_ids(self.object1, self.object2, self._getNearest(positions), positions, material_id)
+
     def getMaterial(self):
         return self.nearest_object.getMaterial()
 
@@ -42,6 +84,20 @@ class IntersectionObject(SceneObject):
 
         return max(distances)
 
+    def getSDFs(self, positions: np.ndarray) -> np.ndarray:
+        return np.maximum(self.object1.getSDFs(positions), self.object2.getSDFs(positions))
+
+    def _getNearest(self, positions: np.ndarray) -> np.ndarray:
+        # The same child `getSDF` picks, for every point at once
+        return self.object1.getSDFs(positions) >= self.object2.getSDFs(positions)
+
+    def getMaterialColors(self, positions: np.ndarray, normals: np.ndarray, footprints: np.ndarray = None) -> np.ndarray:
+        nearest = self._getNearest(positions)
+        return _combine_colors(self.object1, self.object2, nearest, positions, normals, footprints)
+
+    def getMaterialIds(self, positions: np.ndarray, material_id) -> np.ndarray:
+        return _combine_ids(self.object1, self.object2, self._getNearest(positions), positions, material_id)
+
     def getMaterial(self):
         return self.nearest_object.getMaterial()
 
@@ -64,6 +120,20 @@ class DifferenceObject(SceneObject):
 
         return max(distances)
 
+    def getSDFs(self, positions: np.ndarray) -> np.ndarray:
+        return np.maximum(-self.object1.getSDFs(positions), self.object2.getSDFs(positions))
+
+    def _getNearest(self, positions: np.ndarray) -> np.ndarray:
+        # The same child `getSDF` picks, for every point at once
+        return -self.object1.getSDFs(positions) >= self.object2.getSDFs(positions)
+
+    def getMaterialColors(self, positions: np.ndarray, normals: np.ndarray, footprints: np.ndarray = None) -> np.ndarray:
+        nearest = self._getNearest(positions)
+        return _combine_colors(self.object1, self.object2, nearest, positions, normals, footprints)
+
+    def getMaterialIds(self, positions: np.ndarray, material_id) -> np.ndarray:
+        return _combine_ids(self.object1, self.object2, self._getNearest(positions), positions, material_id)
+
     def getMaterial(self):
         return self.nearest_object.getMaterial()
 
@@ -72,7 +142,7 @@ class ScaledObject(SceneObject):
 
     def __init__(self, object1, scale: np.ndarray) -> None:
         self.object1 = object1
-        self.scale = [1 / x for x in scale]
+        self.scale = as_real([1 / x for x in scale])
 
     def getSDF(self, ray: Ray) -> float:
 
@@ -96,5 +166,19 @@ class ScaledObject(SceneObject):
 
         return distance
 
+    def getSDFs(self, positions: np.ndarray) -> np.ndarray:
+        # Same as above, for every point at once
+        pos = self.object1.getPos()
+        return self.object1.getSDFs((positions - pos) * self.scale + pos)
+
+    def getMaterialColors(self, positions: np.ndarray, normals: np.ndarray, footprints: np.ndarray = None) -> np.ndarray:
+        # Combined children have to pick their material where their distances were measured
+        pos = self.object1.getPos()
+        return self.object1.getMaterialColors((positions - pos) * self.scale + pos, normals, footprints)
+
+    def getMaterialIds(self, positions: np.ndarray, material_id) -> np.ndarray:
+        pos = self.object1.getPos()
+        return self.object1.getMaterialIds((positions - pos) * self.scale + pos, material_id)
+
     def getMaterial(self):
         return self.object1.getMaterial()
@@ -3,13 +3,16 @@ import numpy as np
 from ray import Ray
 from scene.materials import Material
 from scene.objects.scene_object import SceneObject
+from util import as_real
 
 
 class Sphere(SceneObject):
     """Defines sphere scene object"""
 
+    analytic = True
+
     def __init__(self, pos: np.ndarray, radius: float, material: Material) -> None:
-        self.pos = pos
+        self.pos = as_real(pos)
         self.radius = radius
         self.material = material
 
@@ -31,6 +34,24 @@ class Sphere(SceneObject):
 
         return math.dist(ray.getPosition(), self.pos) - self.radius
 
+    def getIntersections(self, origins: np.ndarray, directions: np.ndarray) -> np.ndarray:
+        # Solves |o + t * v - pos| = radius for t
+        offset = origins - self.pos
+
+        b = np.einsum("ij,ij->i", offset, directions)
+        c = np.einsum("ij,ij->i", offset, offset) - self.radius * self.radius
+        discriminant = b * b - c
+
+        distances = -b - np.sqrt(np.maximum(discriminant, 0))
+        # Pointing away from, or passing beside the sphere
+        distances = np.where((b > 0) | (discriminant < 0), np.inf, distances)
+
+        # Starting inside the sphere
+        return np.where(c <= 0, 0.0, distances)
+
+    def getSDFs(self, positions: np.ndarray) -> np.ndarray:
+        return np.linalg.norm(positions - self.pos, axis=1) - self.radius
+
     def getMaterial(self):
         return self.material
 
@@ -45,7 +66,7 @@ class Torus(SceneObject):
         minor_radius: float,
         material: Material,
     ) -> None:
-        self.pos = pos
+        self.pos = as_real(pos)
         self.major_radius = major_radius
         self.minor_radius = minor_radius
         self.material = material
@@ -76,6 +97,12 @@ class Torus(SceneObject):
         )
         return math.dist(q, (0, 0)) - self.minor_radius
 
+    def getSDFs(self, positions: np.ndarray) -> np.ndarray:
+        p_relative = positions - self.pos
+
+        q = np.linalg.norm(p_relative[:, :2], axis=1) - self.major_radius
+        return np.hypot(q, p_relative[:, 2]) - self.minor_radius
+
     def getMaterial(self):
         return self.material
 
@@ -86,7 +113,7 @@ class Cylinder(SceneObject):
     def __init__(
         self, pos: np.ndarray, height: float, radius: float, material: Material
     ) -> None:
-        self.pos = pos
+        self.pos = as_real(pos)
         self.radius = radius
         self.height = height
         self.material = material
@@ -117,6 +144,13 @@ class Cylinder(SceneObject):
 
         return f
 
+    def getSDFs(self, positions: np.ndarray) -> np.ndarray:
+        p_relative = positions - self.pos
+
+        d = np.linalg.norm(p_relative[:, :2], axis=1) - self.radius
+        r = np.maximum(-(p_relative[:, 2] + self.height / 2), d)
+        return np.maximum(p_relative[:, 2] - self.height / 2, r)
+
     def getMaterial(self):
         return self.material
 
@@ -125,7 +159,7 @@ class Cube(SceneObject):
     """Defines cube scene object"""
 
     def __init__(self, pos: np.ndarray, side_length: float, material: Material) -> None:
-        self.pos = pos
+        self.pos = as_real(pos)
         self.side_length = side_length
         self.material = material
 
@@ -153,6 +187,9 @@ class Cube(SceneObject):
         d = np.abs(p_relative) - a  # Distance to each face along each axis
         return np.max(d)  # Choose the maximum distance for the closest face
 
+    def getSDFs(self, positions: np.ndarray) -> np.ndarray:
+        return np.max(np.abs(positions - self.pos) - self.side_length / 2, axis=1)
+
     def getMaterial(self):
         return self.material
 
@@ -163,8 +200,8 @@ class Box(SceneObject):
     def __init__(
         self, pos: np.ndarray, side_lengths: np.ndarray, material: Material
     ) -> None:
-        self.pos = pos
-        self.side_lengths = side_lengths
+        self.pos = as_real(pos)
+        self.side_lengths = as_real(side_lengths)
         self.material = material
 
     def getPos(self):
@@ -191,6 +228,9 @@ class Box(SceneObject):
         d = np.abs(p_relative) - a  # Distance to each face along each axis
         return np.max(d)  # Choose the maximum distance for the closest face
 
+    def getSDFs(self, positions: np.ndarray) -> np.ndarray:
+        return np.max(np.abs(positions - self.pos) - self.side_lengths / 2, axis=1)
+
     def getMaterial(self):
         return self.material
 
@@ -205,8 +245,8 @@ class RoundBox(SceneObject):
         radius: float,
         material: Material,
     ) -> None:
-        self.pos = pos
-        self.side_lengths = side_lengths
+        self.pos = as_real(pos)
+        self.side_lengths = as_real(side_lengths)
         self.radius = radius
         self.material = material
 
@@ -236,6 +276,10 @@ class RoundBox(SceneObject):
             np.max(d) - self.radius
         )  # Choose the maximum distance for the closest face
 
+    def getSDFs(self, positions: np.ndarray) -> np.ndarray:
+        d = np.abs(positions - self.pos) - self.side_lengths / 2
+        return np.max(d, axis=1) - self.radius
+
     def getMaterial(self):
         return self.material
 
@@ -243,6 +287,11 @@ class RoundBox(SceneObject):
 class Plane(SceneObject):
     """Defines axis-aligned plane scene object"""
 
+    analytic = True
+
+    # The plane is rendered as a thin slab, so it has a surface to hit from either side
+    thickness = 0.02
+
     def __init__(self, axis: str, pos: float, material: Material) -> None:
         self.axis = axis
         self.pos = pos
@@ -266,20 +315,45 @@ class Plane(SceneObject):
         if self.axis == "Z":
             return (
                 abs(math.dist(ray.getPosition(), (ray.getX(), ray.getY(), self.pos)))
-                - 0.02
+                - self.thickness
             )
         elif self.axis == "Y":
             return (
                 abs(math.dist(ray.getPosition(), (ray.getX(), self.pos, ray.getZ())))
-                - 0.02
+                - self.thickness
             )
         elif self.axis == "X":
             return (
                 abs(math.dist(ray.getPosition(), (self.pos, ray.getY(), ray.getZ())))
-                - 0.02
+                - self.thickness
             )
         else:
             print('Invalid Axis, try "X", "Y", or "Z".')
 
+    def getIntersections(self, origins: np.ndarray, directions: np.ndarray) -> np.ndarray:
+        axis = "XYZ".find(self.axis)
+        if axis < 0:
+            print('Invalid Axis, try "X", "Y", or "Z".')
+            return np.full(len(origins), np.inf)
+
+        offset = origins[:, axis] - self.pos
+        velocity = directions[:, axis]
+
+        # Hits the side of the slab facing the ray, unless travelling parallel to, or away from the plane
+        towards = offset * velocity < 0
+        distances = np.full(len(origins), np.inf)
+        distances[towards] = (np.abs(offset[towards]) - self.thickness) / np.abs(velocity[towards])
+
+        # Starting inside the slab
+        return np.where(np.abs(offset) <= self.thickness, 0.0, distances)
+
+    def getSDFs(self, positions: np.ndarray) -> np.ndarray:
+        axis = "XYZ".find(self.axis)
+        if axis < 0:
+            print('Invalid Axis, try "X", "Y", or "Z".')
+            return np.full(len(positions), np.inf)
+
+        return np.abs(positions[:, axis] - self.pos) - self.thickness
+
     def getMaterial(self):
         return self.material
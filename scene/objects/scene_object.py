@@ -1,11 +1,14 @@
 from ray import Ray
-from util import normalize
+from util import normalize, get_normal_epsilon
 import numpy as np
 
 
 class SceneObject:
     """Defines a generic primitive scene object"""
 
+    # Objects that can intersect a ray in closed form set this, and implement `getIntersections`
+    analytic = False
+
     def __init__(self) -> None:
         pass
 
@@ -15,12 +18,105 @@ class SceneObject:
     def getSDF(self, ray: Ray) -> float:
         pass
 
+    def getSDFs(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Calculates the signed distance from many points at once.
+
+        Objects without a vectorized distance fall back to calling `getSDF` for every point.
+
+        ## Args:
+            `positions`: An (N, 3) array of points.
+
+        ## Returns:
+            An (N,) array of signed distances.
+        """
+
+        ray = Ray((0, 0, 0), (0, 0, 0))
+        distances = np.empty(len(positions), dtype=positions.dtype)
+
+        for index, position in enumerate(positions):
+            ray.setPosition(position)
+            distances[index] = self.getSDF(ray)
+
+        return distances
+
     def getMaterial(self):
         pass
 
+    def getIntersections(self, origins: np.ndarray, directions: np.ndarray) -> np.ndarray:
+        """
+        Calculates where many rays first hit the object, without marching.
+
+        ## Args:
+            `origins`: An (N, 3) array of ray starting points.
+            `directions`: An (N, 3) array of normalized ray directions.
+
+        ## Returns:
+            An (N,) array of distances along each ray to the surface, 0 for rays that start inside,
+            or `np.inf` for rays that never hit.
+        """
+
+        return np.full(len(origins), np.inf)
+
+    def getNormals(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Calculates the surface normal at many points at once, the same way `getNormal` does.
+
+        ## Args:
+            `positions`: An (N, 3) array of points on or near the surface.
+
+        ## Returns:
+            An (N, 3) array of normalized normals.
+        """
+
+        d = self.getSDFs(positions)
+        min_distances = get_normal_epsilon(np.max(np.abs(positions), axis=1))
+
+        normals = np.empty_like(positions)
+        for axis in range(3):
+            offset = np.zeros_like(positions)
+            offset[:, axis] = min_distances
+            normals[:, axis] = d - self.getSDFs(positions - offset)
+
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        return np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+    def getMaterialColors(self, positions: np.ndarray, normals: np.ndarray, footprints: np.ndarray = None) -> np.ndarray:
+        """
+        Calculates the material color at many surface points at once.
+
+        Combined objects override this to pick each point's material from the child nearest to it.
+
+        ## Args:
+            `positions`: An (N, 3) array of surface points.
+            `normals`: An (N, 3) array of the normals at those points.
+            `footprints`: An (N,) array of how wide a pixel is at each point.
+
+        ## Returns:
+            An (N, 3) array of 0 - 255 colors.
+        """
+
+        return self.getMaterial().getColor(positions, normals, footprints)
+
+    def getMaterialIds(self, positions: np.ndarray, material_id) -> np.ndarray:
+        """
+        Finds which material is used at many surface points at once.
+
+        Combined objects override this to pick each point's material from the child nearest to it.
+
+        ## Args:
+            `positions`: An (N, 3) array of surface points.
+            `material_id`: Numbers a material, see `Scene.getMaterialId`.
+
+        ## Returns:
+            An (N,) array of material IDs.
+        """
+
+        return np.full(len(positions), material_id(self.getMaterial()), dtype=np.int32)
+
     def getNormal(self, ray: Ray):
         d = self.getSDF(ray)
-        min_distance = 0.001
+        min_distance = get_normal_epsilon(np.max(np.abs(ray.getPosition())))
 
         x_normal = d - self.getSDF(
             Ray((0, 0, 0), ray.getPosition() - (min_distance, 0.0, 0.0))
@@ -32,7 +128,7 @@ class SceneObject:
             Ray((0, 0, 0), ray.getPosition() - (0.0, 0.0, min_distance))
         )
 
-        normal = np.zeros(3)
+        normal = np.zeros(3, dtype=ray.getPosition().dtype)
         normal[0] = x_normal
         normal[1] = y_normal
         normal[2] = z_normal
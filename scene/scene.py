@@ -1,7 +1,6 @@
 from ray import Ray
 import numpy as np
-import math
-from util import normalize, clamp
+from util import get_hit_epsilon
 
 class Scene:
 
@@ -12,15 +11,48 @@ class Scene:
         min_distance: float,
         max_distance: float,
         do_shading: bool,
+        max_steps: int = 256,
+        adaptive_epsilon: bool = True,
+        occlusion_samples: int = 0,
+        occlusion_distance: float = 0.25,
+        occlusion_falloff: float = 0.75,
     ) -> None:
         self.objects = objects
         self.lights = lights
         self.min_distance = min_distance
         self.max_distance = max_distance
         self.do_shading = do_shading
+        self.max_steps = max_steps
+        self.adaptive_epsilon = adaptive_epsilon
+
+        # Ambient occlusion samples the scene this many times along the normal, up to `occlusion_distance`
+        # from the surface, each sample counting `occlusion_falloff` times as much as the one before it
+        self.occlusion_samples = occlusion_samples
+        self.occlusion_distance = occlusion_distance
+        self.occlusion_falloff = occlusion_falloff
+
         self.distances = []
         self.normal = [0, 0, 0]
 
+        # Objects with a closed form ray intersection are never marched against
+        self.analytic_objects = [object for object in objects if object.analytic]
+        self.marched_objects = [object for object in objects if not object.analytic]
+
+        # Every material in the scene, including those inside combined objects, numbered for ID buffers
+        self.materials = []
+        for object in objects:
+            self._collectMaterials(object)
+        self._material_ids = {id(material): index for index, material in enumerate(self.materials)}
+
+    def _collectMaterials(self, object):
+        material = getattr(object, "material", None)
+        if material is not None and all(material is not known for known in self.materials):
+            self.materials.append(material)
+
+        for child in ("object1", "object2"):
+            if hasattr(object, child):
+                self._collectMaterials(getattr(object, child))
+
     def getSDF(self, ray: Ray) -> float:
         self.distances = []
 
@@ -29,6 +61,86 @@ class Scene:
 
         return min(self.distances)
 
+    def getSDFs(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Calculates the distance to the scene from many points at once.
+
+        Unlike `getSDF`, this does not update the distances used by `getNearestObject`.
+
+        ## Args:
+            `positions`: An (N, 3) array of points.
+
+        ## Returns:
+            An (N,) array of distances to the nearest object.
+        """
+
+        distances = np.full(len(positions), np.inf, dtype=positions.dtype)
+
+        for object in self.objects:
+            distances = np.minimum(distances, object.getSDFs(positions))
+
+        return distances
+
+    def getMarchSDFs(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Calculates the distance from many points to the objects that have to be marched against.
+
+        ## Args:
+            `positions`: An (N, 3) array of points.
+
+        ## Returns:
+            An (N,) array of distances to the nearest object without an analytic intersection, or `np.inf`.
+        """
+
+        distances = np.full(len(positions), np.inf, dtype=positions.dtype)
+
+        for object in self.marched_objects:
+            distances = np.minimum(distances, object.getSDFs(positions))
+
+        return distances
+
+    def getIntersections(self, origins: np.ndarray, directions: np.ndarray) -> np.ndarray:
+        """
+        Calculates where many rays first hit any object with an analytic intersection, without marching.
+
+        ## Args:
+            `origins`: An (N, 3) array of ray starting points.
+            `directions`: An (N, 3) array of normalized ray directions.
+
+        ## Returns:
+            An (N,) array of distances along each ray to the nearest hit, or `np.inf`.
+        """
+
+        distances = np.full(len(origins), np.inf)
+
+        for object in self.analytic_objects:
+            distances = np.minimum(distances, object.getIntersections(origins, directions))
+
+        return distances
+
+    def getHitDistances(self, positions: np.ndarray, distances_traveled: np.ndarray, pixel_angle) -> np.ndarray:
+        """
+        Calculates how close rays have to get to the scene to count as a hit.
+
+        ## Args:
+            `positions`: An (N, 3) array of where the rays are.
+            `distances_traveled`: An (N,) array of how far each ray got.
+            `pixel_angle`: Angular size of one pixel, see `Camera.getPixelAngle`, for all rays or one per ray.
+
+        ## Returns:
+            An (N,) array of `min_distance`, or with `adaptive_epsilon` half the pixel's footprint
+            at each ray's distance if that is larger.
+        """
+
+        # Never ask for more than the current precision can resolve at the rays' positions
+        min_distances = get_hit_epsilon(self.min_distance, np.max(np.abs(positions), axis=1))
+
+        if not self.adaptive_epsilon:
+            return min_distances
+
+        # Detail smaller than the pixel a ray covers can not show up in the image anyway
+        return np.maximum(min_distances, distances_traveled * pixel_angle * 0.5)
+
     def getNormal(self, ray: Ray):
         normal = self.getNearestObject(ray).getNormal(ray)
         self.normal = normal
@@ -38,96 +150,215 @@ class Scene:
         # Base Color of object
         index = np.argmin(self.distances)  # Get Index of nearest object
         return self.objects[index]  # Get nearest object
+
+    def getNearestObjectIndices(self, positions: np.ndarray) -> np.ndarray:
+        """Finds the index of the nearest object to every point of an (N, 3) array."""
+
+        return np.argmin([object.getSDFs(positions) for object in self.objects], axis=0)
+
+    def getNormals(self, positions: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        """
+        Calculates the normal at many hit points, each from the object nearest to it.
+
+        ## Args:
+            `positions`: An (N, 3) array of hit points.
+            `indices`: The nearest object to every point, see `getNearestObjectIndices`.
+
+        ## Returns:
+            An (N, 3) array of normalized normals.
+        """
+
+        normals = np.zeros_like(positions)
+
+        for index in np.unique(indices):
+            mask = indices == index
+            normals[mask] = self.objects[index].getNormals(positions[mask])
+
+        return normals
+
+    def getMaterialColors(
+        self, positions: np.ndarray, normals: np.ndarray, indices: np.ndarray, footprints: np.ndarray = None
+    ) -> np.ndarray:
+        """
+        Calculates the material color at many hit points, each from the object nearest to it.
+
+        ## Args:
+            `positions`: An (N, 3) array of hit points.
+            `normals`: An (N, 3) array of the normals at those points.
+            `indices`: The nearest object to every point, see `getNearestObjectIndices`.
+            `footprints`: An (N,) array of how wide a pixel is at each point, so patterns can be filtered.
+
+        ## Returns:
+            An (N, 3) array of 0 - 255 colors.
+        """
+
+        colors = np.zeros((len(positions), 3))
+
+        for index in np.unique(indices):
+            mask = indices == index
+            colors[mask] = self.objects[index].getMaterialColors(
+                positions[mask], normals[mask], None if footprints is None else footprints[mask]
+            )
+
+        return colors
+
+    def getMaterialIds(self, positions: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        """
+        Finds the material at many hit points, each from the object nearest to it.
+
+        ## Args:
+            `positions`: An (N, 3) array of hit points.
+            `indices`: The nearest object to every point, see `getNearestObjectIndices`.
+
+        ## Returns:
+            An (N,) array of indices into `materials`, -1 where an object has none.
+        """
+
+        ids = np.full(len(positions), -1, dtype=np.int32)
+
+        for index in np.unique(indices):
+            mask = indices == index
+            ids[mask] = self.objects[index].getMaterialIds(positions[mask], self.getMaterialId)
+
+        return ids
+
+    def getMaterialId(self, material) -> int:
+        return self._material_ids.get(id(material), -1)
         
 
-    def getColor(self, ray: Ray):
+    def getAmbient(self):
+        """The light every hit gets regardless of lights and shadows, already in 0 - 255 colors."""
+
+        # Unshaded scenes show their objects' own colors
+        if self.lights and not self.do_shading:
+            return np.zeros(3)
+
+        return np.array((17.0, 17.0, 17.0))
+
+    def getLightings(self, positions: np.ndarray, normals: np.ndarray) -> np.ndarray:
+        """
+        Calculates how much light from every light reaches many hit points, including soft shadows.
 
-        nearest_object = self.getNearestObject(ray)
+        Materials are left out, so their colors can be worked out later, all at once. A hit's color
+        is `getAmbient() + color * lighting`, and every shadow ray is marched in one batch.
 
-        # Set the base color of the pixel to the nearest objects material color
-        object_color = nearest_object.getMaterial().getColor()
+        ## Args:
+            `positions`: An (N, 3) array of hit points.
+            `normals`: An (N, 3) array of the normals at those points, see `getNormals`.
 
-        color = (17, 17, 17)  # Start with a blank (or black) color
+        ## Returns:
+            An (N, 3) array of the light reaching every point per color channel,
+            from 0 (dark) to 1 (full light) per light.
+        """
 
-        # Calculate the scene's normal at the ray's position
-        normal = self.getNormal(ray)
+        irradiance = np.zeros((len(positions), 3))
+
+        if not self.do_shading:
+            # Without shading, every object is shown in its plain color
+            return irradiance + (1 if self.lights else 0)
 
-        # Shading
         for light in self.lights:
-            if not self.do_shading:
-                color = object_color
-                break
+            to_light = light.getPosition() - positions
+            to_light /= np.linalg.norm(to_light, axis=1)[:, np.newaxis]
 
-            # Diffused Lighting
-            brightness = np.dot(light.getLightVector(ray), normal)
+            # Diffused lighting, only surfaces facing the light can be in its shadow
+            brightness = np.clip(np.einsum("ij,ij->i", to_light, normals), 0, 1)
+            facing = np.flatnonzero(brightness > 0)
+            brightness[facing] *= self.getShadows(positions[facing], normals[facing], light, 16)
 
-            # Clamp brightness between 0 and 1, because negative brightness does not exist!
-            brightness = clamp(brightness, 0, 1)
+            light_color = np.divide(light.getColor(), 255)
+            irradiance += np.multiply.outer(brightness * light.getIntensity(), light_color)
 
-            # Apply shadows
-            brightness *= self.isInShadow(ray, light, normal, 16)
+        return irradiance
 
-            # Multiply the brightness by the light's intensity to allow for dimming
-            brightness *= light.getIntensity()
+    def getAmbientOcclusion(self, positions: np.ndarray, normals: np.ndarray) -> np.ndarray:
+        """
+        Estimates how much of the ambient light reaches many surface points, from the scene's SDF alone.
 
-            # Get the light's color
-            light_color = light.getColor()
+        Every point is sampled `occlusion_samples` times at even steps along its normal. Open space
+        leaves each sample as far from the scene as it is from the surface, anything nearer means
+        something is close by and blocking light. Costs one batched `getSDFs` per sample, however
+        many points there are.
 
-            # Now we are going to compine the light_color and object_color into one by multiplying
-            # This works best when at least one is converted to 0 - 1.
-            light_color = np.divide(light_color, 255)
+        ## Args:
+            `positions`: An (N, 3) array of hit points.
+            `normals`: An (N, 3) array of the surface normals at those points.
 
-            # object_color * light_color * brightness
-            color += np.multiply(np.multiply(object_color, light_color), brightness)
+        ## Returns:
+            An (N,) array from 0 (fully occluded) to 1 (unoccluded).
+        """
 
-        return color
+        occlusion = np.zeros(len(positions))
+        total = 0.0
+        weight = 1.0
 
-    def isInShadow(self, ray: Ray, light, normal, softness):
-        starting_pos = ray.getPosition()
-        starting_velocity = ray.getVelocity()
+        for sample in range(1, self.occlusion_samples + 1):
+            height = self.occlusion_distance * sample / self.occlusion_samples
+            d = self.getSDFs(positions + normals * height)
 
-        # We need to move the ray away from the surface a bit to not detect a false hit
-        ray.setPosition(ray.getPosition() + (normal * self.min_distance * 2))
+            occlusion += weight * np.maximum(height - d, 0)
+            total += weight * height
+            weight *= self.occlusion_falloff
 
-        # Move the ray to face the light
-        ray.setVelocity(light.getLightVector(ray))
-        ray.resetDistance()
+        if total == 0:
+            return np.ones(len(positions))
 
-        # To figure out if we are in a shadow, we march towards the light,
-        # if the distance we traveled is shorter than our distance from the light,
-        # we are in a shadow
-        distance = lambda ray: self.getSDF(ray)
+        return np.clip(1 - occlusion / total, 0, 1)
 
-        brightness = 1.0
+    def getShadows(self, positions: np.ndarray, normals: np.ndarray, light, softness) -> np.ndarray:
+        """
+        Calculates how much of a light reaches many surface points, with soft shadows.
 
-        d = distance(ray)
-        while (d > self.min_distance) and (ray.distance_traveled < self.max_distance):
-            d = distance(ray)
+        Every point marches towards the light. If the march hits something before getting
+        to the light, the point is in shadow. Otherwise, the closer the ray passed by
+        something compared to how far it had gone, the darker the penumbra.
 
-            # Step smaller steps as we get closer to the scene to improve pnumara quality
-            # move = min(.2 * math.pow(d, 2), d)
-            # d = max(0.2 * d, d - 5) - 2
-            # d *= 0.7 # Working
+        ## Args:
+            `positions`: An (N, 3) array of surface points.
+            `normals`: An (N, 3) array of the normals at those points.
+            `light`: The light to march towards.
+            `softness`: How sharp the penumbra is, higher is sharper.
 
-            # min(.0x^2+0.1, x) - 1
+        ## Returns:
+            An (N,) array from 0 (in shadow) to 1 (fully lit).
+        """
 
-            if d <= 0.5:
-                ray.step(d * 0.5)
-            else:
-                ray.step(d)
+        count = len(positions)
 
-            brightness = min((d / ray.distance_traveled) * softness, brightness)
+        # We need to move the rays away from the surface a bit to not detect a false hit
+        offset = get_hit_epsilon(self.min_distance, np.max(np.abs(positions), axis=1)) * 2
+        origins = positions + normals * offset[:, np.newaxis]
+
+        directions = light.getPosition() - origins
+        directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
 
         # The distance we were from the light when we started
-        starting_distance = math.dist(starting_pos, light.getPosition())
-
-        # Put the ray back where it was
-        ray.setPosition(starting_pos)
-        ray.setVelocity(starting_velocity)
-
-        if ray.distance_traveled >= starting_distance:
-            # We were not in a shadow
-            return brightness
-        else:
-            # We were in a shadow
-            return 0.0
+        starting_distances = np.linalg.norm(light.getPosition() - positions, axis=1)
+
+        # Objects with an exact intersection either block the light or they don't
+        blocked = self.getIntersections(origins, directions) < starting_distances
+
+        brightness = np.ones(count)
+        if not self.marched_objects:
+            return np.where(blocked, 0.0, brightness)
+
+        traveled = np.zeros(count, dtype=positions.dtype)
+        d = np.zeros(count, dtype=positions.dtype)
+
+        active = np.flatnonzero(~blocked)
+        d[active] = self.getMarchSDFs(origins[active])
+
+        # Rays stop one step after getting closer than `min_distance`
+        while len(active):
+            active = active[(d[active] > self.min_distance) & (traveled[active] < self.max_distance)]
+            if not len(active):
+                break
+
+            step = self.getMarchSDFs(origins[active] + directions[active] * traveled[active, np.newaxis])
+            d[active] = step
+
+            # Smaller steps close to the scene improve the penumbra
+            traveled[active] += np.where(step <= 0.5, step * 0.5, step)
+            brightness[active] = np.minimum(step / traveled[active] * softness, brightness[active])
+
+        return np.where(blocked | (traveled < starting_distances), 0.0, brightness)
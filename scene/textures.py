@@ -0,0 +1,220 @@
+import numpy as np
+import hashlib
+import os
+from PIL import Image
+
+
+class GradientNoise:
+    """
+    Defines 3D gradient (Perlin) noise over an integer lattice.
+
+    The permutation and gradient tables are built once per seed, after that every
+    lookup is a table index, so whole batches of points are evaluated at once.
+    """
+
+    def __init__(self, seed: int = 0) -> None:
+        self.seed = seed
+
+        random = np.random.default_rng(seed)
+
+        # Doubled, so hashing three lattice coordinates never has to wrap
+        permutation = random.permutation(256)
+        self.permutation = np.concatenate((permutation, permutation)).astype(np.int32)
+
+        # One random unit gradient per hash value
+        gradients = random.normal(size=(256, 3))
+        self.gradients = gradients / np.linalg.norm(gradients, axis=1, keepdims=True)
+
+    def _hash(self, x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+        permutation = self.permutation
+        return permutation[permutation[permutation[x] + y] + z]
+
+    def getNoise(self, points: np.ndarray) -> np.ndarray:
+        """
+        Samples the noise at many points.
+
+        ## Args:
+            `points`: An (N, 3) array of points, in lattice cells.
+
+        ## Returns:
+            An (N,) array of values, roughly from -1 to 1 and 0 at every lattice corner.
+        """
+
+        cell = np.floor(points)
+        local = points - cell
+        cell = cell.astype(np.int64) & 255
+
+        # Smootherstep, so the noise is continuous in its first and second derivatives
+        fade = local * local * local * (local * (local * 6 - 15) + 10)
+
+        x, y, z = cell[:, 0], cell[:, 1], cell[:, 2]
+        values = np.empty((8, len(points)))
+
+        for corner in range(8):
+            offset = np.array(((corner >> 2) & 1, (corner >> 1) & 1, corner & 1))
+            gradient = self.gradients[self._hash(x + offset[0], y + offset[1], z + offset[2])]
+            values[corner] = np.einsum("ij,ij->i", gradient, local - offset)
+
+        # Interpolate along z, then y, then x
+        u, v, w = fade[:, 0], fade[:, 1], fade[:, 2]
+        values = values[0::2] + w * (values[1::2] - values[0::2])
+        values = values[0::2] + v * (values[1::2] - values[0::2])
+        values = values[0] + u * (values[1] - values[0])
+
+        # Random unit gradients peak a little under 1, stretch them to about -1 to 1
+        return values * 1.5
+
+    def getFBM(
+        self,
+        points: np.ndarray,
+        octaves: int = 4,
+        lacunarity: float = 2.0,
+        gain: float = 0.5,
+        footprints: np.ndarray = None,
+    ) -> np.ndarray:
+        """
+        Sums octaves of noise at rising frequency and falling amplitude (fractal Brownian motion).
+
+        ## Args:
+            `points`: An (N, 3) array of points, in lattice cells of the first octave.
+            `octaves`: How many layers of noise to add.
+            `lacunarity`: How much the frequency grows from one octave to the next.
+            `gain`: How much the amplitude shrinks from one octave to the next.
+            `footprints`: An (N,) array of how many first octave cells a pixel covers at each point.
+                Octaves finer than a pixel fade out, rather than aliasing.
+
+        ## Returns:
+            An (N,) array of values, normalized to roughly -1 to 1.
+        """
+
+        total = np.zeros(len(points))
+        frequency = 1.0
+        amplitude = 1.0
+        normalization = 0.0
+
+        for octave in range(octaves):
+            value = self.getNoise(points * frequency + octave * 17.0) * amplitude
+
+            if footprints is not None:
+                # A lattice cell of this octave against the size of the pixel
+                value *= np.clip(1 / (frequency * footprints) - 1, 0, 1)
+
+            total += value
+            normalization += amplitude
+            frequency *= lacunarity
+            amplitude *= gain
+
+        return total / normalization
+
+
+class Texture:
+    """
+    Defines an image, with its mip levels, shared by every material that uses it.
+
+    Each mip level halves the one before it, down to a single pixel, so minified
+    lookups average the texels a pixel covers instead of skipping over them.
+    """
+
+    def __init__(self, key: str, image: np.ndarray) -> None:
+        self.key = key
+        self.levels = [np.asarray(image, dtype=np.float32)]
+
+        while min(self.levels[-1].shape[:2]) > 1:
+            level = self.levels[-1]
+            height, width = (level.shape[0] // 2) * 2, (level.shape[1] // 2) * 2
+            level = level[:height, :width]
+
+            # Average every 2x2 block
+            self.levels.append(
+                (level[0::2, 0::2] + level[1::2, 0::2] + level[0::2, 1::2] + level[1::2, 1::2]) / 4
+            )
+
+    def _sampleLevel(self, uv: np.ndarray, level: int) -> np.ndarray:
+        image = self.levels[level]
+        height, width = image.shape[:2]
+
+        # Texel centers, wrapping around so the texture tiles
+        x = uv[:, 0] * width - 0.5
+        y = uv[:, 1] * height - 0.5
+        x0, y0 = np.floor(x), np.floor(y)
+        fx, fy = (x - x0)[:, np.newaxis], (y - y0)[:, np.newaxis]
+
+        x0, y0 = x0.astype(np.int64) % width, y0.astype(np.int64) % height
+        x1, y1 = (x0 + 1) % width, (y0 + 1) % height
+
+        top = image[y0, x0] + fx * (image[y0, x1] - image[y0, x0])
+        bottom = image[y1, x0] + fx * (image[y1, x1] - image[y1, x0])
+        return top + fy * (bottom - top)
+
+    def sample(self, uv: np.ndarray, footprints: np.ndarray = None) -> np.ndarray:
+        """
+        Samples the texture with trilinear filtering.
+
+        ## Args:
+            `uv`: An (N, 2) array of texture coordinates, one texture across 0 to 1.
+            `footprints`: An (N,) array of how much of the texture a pixel covers at each point,
+                which picks the mip levels. Without it, the full resolution image is used.
+
+        ## Returns:
+            An (N, 3) array of colors.
+        """
+
+        if footprints is None:
+            return self._sampleLevel(uv, 0)
+
+        size = max(self.levels[0].shape[:2])
+        level = np.clip(np.log2(np.maximum(footprints * size, 1e-12)), 0, len(self.levels) - 1)
+
+        lower = np.floor(level).astype(np.int64)
+        blend = (level - lower)[:, np.newaxis]
+        colors = np.empty((len(uv), 3))
+
+        # Points are grouped by level, so every lookup stays vectorized
+        for index in np.unique(lower):
+            mask = lower == index
+            upper = min(index + 1, len(self.levels) - 1)
+
+            colors[mask] = self._sampleLevel(uv[mask], index) * (1 - blend[mask]) + (
+                self._sampleLevel(uv[mask], upper) * blend[mask]
+            )
+
+        return colors
+
+
+# Noise tables, by seed
+_noises = {}
+
+# Textures loaded by this process, by (path, modification time, size)
+_textures = {}
+
+
+def get_noise(seed: int = 0) -> GradientNoise:
+    if seed not in _noises:
+        _noises[seed] = GradientNoise(seed)
+
+    return _noises[seed]
+
+
+def load_texture(file_name: str) -> Texture:
+    """
+    Loads an image file, reusing it and its mip levels if this process loaded it before.
+
+    ## Args:
+        `file_name`: Path to any image PIL can read.
+
+    ## Returns:
+        The shared texture for the file.
+    """
+
+    path = os.path.abspath(file_name)
+    stat = os.stat(path)
+    file_key = (path, stat.st_mtime_ns, stat.st_size)
+
+    if file_key not in _textures:
+        image = np.asarray(Image.open(path).convert("RGB"))
+        # The same bytes make different images at different sizes
+        key = hashlib.sha256(repr(image.shape).encode() + image.tobytes()).hexdigest()
+
+        _textures[file_key] = Texture(key, image)
+
+    return _textures[file_key]
@@ -0,0 +1,672 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Imports
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import runpy
+import subprocess
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from processing import ToneMapping
+from renderer import render_region, shade_materials, ambient_occlusion
+from buffers import RenderBuffers
+
+# Defaults
+host = "127.0.0.1"
+port = 8765
+rows_per_tile = 4
+
+# Clients can only render scene files inside `scene_directory`, and only save images inside `output_directory`
+scene_directory = os.path.dirname(os.path.abspath(__file__))
+output_directory = os.path.join(scene_directory, "renders")
+
+# Finished jobs are kept for `status` until this many more have finished after them
+max_finished_jobs = 100
+
+
+# Worker Side
+
+# Scene files this worker has loaded, by path and modification time
+_scenes = {}
+
+
+def _warm_worker():
+    # Pay for the heavy imports once per worker, instead of once per render
+    import trimesh
+    import scene.objects.mesh
+    import scene.objects.primative
+
+
+def _ping():
+    return os.getpid()
+
+
+def _load_scene(scene_file: str):
+    path = os.path.abspath(scene_file)
+    key = (path, os.stat(path).st_mtime_ns)
+
+    if key not in _scenes:
+        # Run the file as a module that is not __main__, so it only builds its scene
+        _scenes[key] = runpy.run_path(path, run_name="__scene__")
+
+    return _scenes[key]
+
+
+def get_scene_resolution(scene_file: str):
+    values = _load_scene(scene_file)
+    return values.get("image_width", 32), values.get("image_height", 18)
+
+
+def render_rows(scene_file: str, image_width: int, image_height: int, row_start: int, row_stop: int):
+    """
+    Renders a band of rows of a scene file's image.
+
+    ## Args:
+        `scene_file`: A Python file that defines `scene` and `camera`.
+        `image_width`: Width of the whole image in pixels.
+        `image_height`: Height of the whole image in pixels.
+        `row_start`: First row to render.
+        `row_stop`: Row to stop before.
+
+    ## Returns:
+        A (rows, width, 3) array of HDR colors.
+    """
+
+    values = _load_scene(scene_file)
+    scene, camera = values["scene"], values["camera"]
+
+    # Only the band's own directions and buffers, the pixel angle only depends on the width
+    directions = camera.getRayDirections(image_width, image_height)[row_start:row_stop]
+
+    # The whole band is marched, lit and shaded at once, like a tile of `render_image`
+    buffers = RenderBuffers(image_width, row_stop - row_start, deferred=True)
+
+    render_region(scene, camera, directions, buffers)
+    colors = shade_materials(scene, camera, directions, buffers)
+
+    if scene.occlusion_samples > 0:
+        colors *= ambient_occlusion(scene, camera, directions, buffers)[:, :, np.newaxis]
+
+    return colors
+
+
+def resolve_inside(directory: str, path: str, allow_absolute: bool = False) -> str:
+    """
+    Resolves a path a client sent, relative to the only directory it may point into.
+
+    ## Args:
+        `directory`: The directory the path has to stay in.
+        `path`: A relative path without `..`.
+        `allow_absolute`: Also accept absolute paths, as long as they are inside `directory`.
+
+    ## Returns:
+        The absolute path, with symbolic links resolved.
+
+    ## Raises:
+        `PermissionError`: The path is absolute when it may not be, uses `..`, or doesn't lead to a file in `directory`.
+    """
+
+    if not isinstance(path, str) or (os.path.isabs(path) and not allow_absolute):
+        raise PermissionError(f"{path!r} must be a path relative to {directory!r}")
+
+    directory = os.path.realpath(directory)
+    resolved = os.path.realpath(os.path.join(directory, path))
+
+    if ".." in path.replace("\\", "/").split("/") or os.path.commonpath((directory, resolved)) != directory:
+        raise PermissionError(f"{path!r} is outside {directory!r}")
+
+    if resolved == directory:
+        raise PermissionError(f"{path!r} is {directory!r} itself, not a file in it")
+
+    return resolved
+
+
+def check_output(output: str):
+    """Makes sure an image can be saved to `output`, before any time is spent rendering it."""
+
+    directory = os.path.dirname(os.path.abspath(output))
+    os.makedirs(directory, exist_ok=True)
+
+    if os.path.isdir(output) or not os.access(directory, os.W_OK):
+        raise PermissionError(f"Can't save an image to {output!r}")
+
+
+def check_size(name: str, value):
+    if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+        raise ValueError(f"{name} must be a positive integer, not {value!r}")
+
+
+def save_image(colors: np.ndarray, output: str):
+    colors = ToneMapping.extendedReinhard(colors)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    Image.fromarray(np.clip(colors, 0, 255).astype(np.uint8), mode="RGB").save(output, format="png")
+
+
+# Service Side
+
+
+class RenderJob:
+    """Defines one image being rendered by the service, split into bands of rows"""
+
+    def __init__(
+        self, job_id: int, key, scene_file: str, image_width: int, image_height: int, priority: int
+    ) -> None:
+        self.id = job_id
+        self.key = key
+        self.scene_file = scene_file
+        self.image_width = image_width
+        self.image_height = image_height
+        self.priority = priority
+        self.outputs = []
+
+        self.tiles = [
+            (start, min(start + rows_per_tile, image_height))
+            for start in range(0, image_height, rows_per_tile)
+        ]
+        self.pending = deque(self.tiles)
+        self.tiles_done = 0
+
+        self.colors = np.zeros((image_height, image_width, 3))
+        self.state = "queued"
+        self.submitted = time.time()
+
+        self.subscribers = []
+
+    def publish(self, event: dict):
+        event = {"job": self.id, **event}
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(event)
+
+    def isFinished(self) -> bool:
+        return self.state in ("done", "cancelled", "failed")
+
+
+class RenderService:
+    """
+    Renders scene files for clients on a local socket, with a pool of warm worker processes.
+
+    Requests are JSON lines. `{"command": "render", "scene": file}` queues a job and streams
+    its events back, `{"command": "cancel", "job": id}` cancels one and `{"command": "status"}`
+    lists them. Jobs with a higher `priority` get their tiles rendered first, and a request
+    identical to a job that is still pending joins that job instead of queueing another.
+    """
+
+    def __init__(
+        self,
+        host: str = host,
+        port: int = port,
+        workers: int = None,
+        scene_directory: str = scene_directory,
+        output_directory: str = output_directory,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+
+        # Anyone who can reach the socket can send requests, so they only get to read scenes and write images here
+        self.scene_directory = scene_directory
+        self.output_directory = output_directory
+
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_warm_worker)
+        self.jobs = {}
+        self.active = {}
+        self.finished = deque()
+        self.queue = []
+        self.ids = itertools.count(1)
+        self.server = None
+        self.tasks = []
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.has_work = asyncio.Condition()
+
+        # Start every worker now, so the first job doesn't pay for it
+        await asyncio.gather(
+            *[loop.run_in_executor(self.executor, _ping) for _ in range(self.workers)]
+        )
+
+        self.tasks = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+
+        # Port 0 picks a free port, clients need to know which
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serveForever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def submit(
+        self,
+        scene_file: str,
+        image_width: int = None,
+        image_height: int = None,
+        priority: int = 0,
+        output: str = None,
+    ):
+        """
+        Queues a render, or joins an identical one that hasn't finished.
+
+        ## Args:
+            `scene_file`: A Python file inside `scene_directory`, relative to it or absolute.
+            `image_width`: Width of the image, or `None` for the scene file's own.
+            `image_height`: Height of the image, or `None` for the scene file's own.
+            `priority`: Jobs with a higher priority get their tiles rendered first.
+            `output`: Where to save the image, relative to `output_directory`.
+
+        ## Returns:
+            The job, and whether it was joined rather than created.
+
+        ## Raises:
+            `ValueError`: The size or priority is not an integer, the size is not positive,
+                or the scene is not a Python file.
+            `PermissionError`: The scene file or output is outside its directory.
+            `OSError`: The scene file doesn't exist, or the image could not be saved to `output`.
+        """
+
+        if not isinstance(priority, int) or isinstance(priority, bool):
+            raise ValueError(f"priority must be an integer, not {priority!r}")
+
+        for name, value in (("width", image_width), ("height", image_height)):
+            if value is not None:
+                check_size(name, value)
+
+        # Fail now rather than after rendering, the default output only differs by job ID
+        if output is not None:
+            output = resolve_inside(self.output_directory, output)
+        check_output(output or os.path.join(self.output_directory, "service.png"))
+
+        # Scene files are run as Python by the workers, so only the ones in the scene directory
+        scene_file = resolve_inside(self.scene_directory, scene_file, allow_absolute=True)
+        if not scene_file.endswith(".py"):
+            raise ValueError(f"Scenes must be Python files, not {scene_file!r}")
+
+        if image_width is None or image_height is None:
+            loop = asyncio.get_running_loop()
+            width, height = await loop.run_in_executor(
+                self.executor, get_scene_resolution, scene_file
+            )
+            image_width = image_width or width
+            image_height = image_height or height
+
+            # A scene file could ask for anything
+            check_size("width", image_width)
+            check_size("height", image_height)
+
+        key = (scene_file, os.stat(scene_file).st_mtime_ns, image_width, image_height)
+
+        job = self.active.get(key)
+        coalesced = job is not None
+
+        if job is None:
+            job = RenderJob(next(self.ids), key, scene_file, image_width, image_height, priority)
+            self.jobs[job.id] = job
+            self.active[key] = job
+            heapq.heappush(self.queue, (-priority, job.id, job))
+
+        elif priority > job.priority:
+            # Someone wants the shared job sooner, so queue it again at the higher priority
+            job.priority = priority
+            heapq.heappush(self.queue, (-priority, job.id, job))
+
+        output = output or os.path.join(self.output_directory, f"service_{job.id}.png")
+        if output not in job.outputs:
+            job.outputs.append(output)
+
+        async with self.has_work:
+            self.has_work.notify_all()
+
+        return job, coalesced
+
+    def cancel(self, job_id: int) -> bool:
+        job = self.jobs.get(job_id)
+
+        if job is None or job.isFinished():
+            return False
+
+        # Tiles already being rendered finish, but their results are thrown away
+        job.pending.clear()
+        self._finish(job, "cancelled", {"event": "cancelled"})
+
+        return True
+
+    def _finish(self, job: RenderJob, state: str, event: dict):
+        job.state = state
+        self.active.pop(job.key, None)
+        job.publish(event)
+
+        # The image is saved by now, or never will be, only the job's status is kept
+        job.colors = None
+        self.finished.append(job)
+
+        while len(self.finished) > max_finished_jobs:
+            self.jobs.pop(self.finished.popleft().id, None)
+
+    def _hasTile(self) -> bool:
+        # Drop finished jobs from the front of the queue, and report whether a tile is waiting
+        while self.queue:
+            _, _, job = self.queue[0]
+            if not job.isFinished() and job.pending:
+                return True
+            heapq.heappop(self.queue)
+
+        return False
+
+    def _nextTile(self):
+        _, _, job = self.queue[0]
+        return job, job.pending.popleft()
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            async with self.has_work:
+                await self.has_work.wait_for(self._hasTile)
+                job, (row_start, row_stop) = self._nextTile()
+
+            if job.state == "queued":
+                job.state = "running"
+                job.publish({"event": "started"})
+
+            # Anything going wrong fails the job, never the dispatcher
+            try:
+                colors = await loop.run_in_executor(
+                    self.executor,
+                    render_rows,
+                    job.scene_file,
+                    job.image_width,
+                    job.image_height,
+                    row_start,
+                    row_stop,
+                )
+
+                if job.isFinished():
+                    continue
+
+                job.colors[row_start:row_stop] = colors
+                job.tiles_done += 1
+                job.publish({"event": "progress", "done": job.tiles_done, "total": len(job.tiles)})
+
+                if job.tiles_done == len(job.tiles):
+                    for output in job.outputs:
+                        save_image(job.colors, output)
+
+                    self._finish(
+                        job,
+                        "done",
+                        {"event": "done", "outputs": job.outputs, "seconds": time.time() - job.submitted},
+                    )
+            except Exception as error:
+                if not job.isFinished():
+                    job.pending.clear()
+                    self._finish(job, "failed", {"event": "failed", "error": repr(error)})
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def send(message: dict):
+            writer.write((json.dumps(message) + "\n").encode())
+            await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    command = request.get("command")
+                except (json.JSONDecodeError, AttributeError):
+                    # Nothing else speaks this protocol, so stop before acting on any more of it,
+                    # such as the body of an HTTP request a web page sent here
+                    await send({"event": "error", "error": "Requests must be JSON objects"})
+                    break
+
+                if command == "render":
+                    try:
+                        job, coalesced = await self.submit(
+                            request["scene"],
+                            request.get("width"),
+                            request.get("height"),
+                            request.get("priority", 0),
+                            request.get("output"),
+                        )
+                    except Exception as error:
+                        # Bad requests, and scene files that fail while finding their resolution
+                        await send({"event": "error", "error": repr(error)})
+                        continue
+
+                    await self._stream(job, coalesced, send)
+
+                elif command == "cancel":
+                    if not self.cancel(request.get("job")):
+                        await send({"event": "error", "error": "No such unfinished job"})
+                    else:
+                        await send({"event": "cancelled", "job": request.get("job")})
+
+                elif command == "status":
+                    await send(
+                        {
+                            "event": "status",
+                            "jobs": [
+                                {
+                                    "job": job.id,
+                                    "scene": job.scene_file,
+                                    "state": job.state,
+                                    "priority": job.priority,
+                                    "done": job.tiles_done,
+                                    "total": len(job.tiles),
+                                }
+                                for job in self.jobs.values()
+                            ],
+                        }
+                    )
+
+                else:
+                    await send({"event": "error", "error": f"Unknown command {command!r}"})
+
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _stream(self, job: RenderJob, coalesced: bool, send):
+        events = asyncio.Queue()
+        job.subscribers.append(events)
+
+        try:
+            await send({"event": "queued", "job": job.id, "coalesced": coalesced})
+
+            if job.isFinished():
+                return
+
+            while True:
+                event = await events.get()
+                await send(event)
+
+                if event["event"] in ("done", "cancelled", "failed"):
+                    break
+        finally:
+            job.subscribers.remove(events)
+
+
+# Client Side
+
+
+async def request(message: dict, host: str = host, port: int = port, on_event=None) -> dict:
+    """
+    Sends one request to a running service.
+
+    ## Args:
+        `message`: The request, see `RenderService`.
+        `on_event`: Called with every event the service sends back.
+
+    ## Returns:
+        The last event, for renders the one that finished the job.
+    """
+
+    reader, writer = await asyncio.open_connection(host, port)
+
+    try:
+        writer.write((json.dumps(message) + "\n").encode())
+        await writer.drain()
+
+        while line := await reader.readline():
+            event = json.loads(line)
+
+            if on_event is not None:
+                on_event(event)
+
+            if message.get("command") != "render" or event["event"] in (
+                "done",
+                "cancelled",
+                "failed",
+                "error",
+            ):
+                return event
+    finally:
+        writer.close()
+
+
+def render_locally(scene_file: str, image_width: int = None, image_height: int = None, output: str = None):
+    """Renders a scene file in this process, the way a fresh `python ray_marching.py` would."""
+
+    if image_width is None or image_height is None:
+        width, height = get_scene_resolution(scene_file)
+        image_width = image_width or width
+        image_height = image_height or height
+
+    colors = render_rows(scene_file, image_width, image_height, 0, image_height)
+    save_image(colors, output or os.path.join("renders", "local.png"))
+
+
+def time_cold_render(scene_file: str, image_width: int = None, image_height: int = None) -> float:
+    """Times a render in a brand new Python process, imports and scene loading included."""
+
+    command = [sys.executable, os.path.abspath(__file__), "local", scene_file]
+    if image_width is not None:
+        command += ["--width", str(image_width)]
+    if image_height is not None:
+        command += ["--height", str(image_height)]
+
+    start_time = time.time()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return time.time() - start_time
+
+
+async def _serve(arguments):
+    service = RenderService(
+        arguments.host, arguments.port, arguments.workers, arguments.scene_directory, arguments.output_directory
+    )
+    await service.start()
+
+    print(f"Render service listening on {arguments.host}:{arguments.port} with {service.workers} workers")
+    print(f"Rendering scenes in {service.scene_directory} into {service.output_directory}")
+
+    try:
+        await service.serveForever()
+    finally:
+        await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local render service")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # Every command talks to, or is, the service at this address
+    address = argparse.ArgumentParser(add_help=False)
+    address.add_argument("--host", default=host)
+    address.add_argument("--port", type=int, default=port)
+
+    serve = commands.add_parser("serve", parents=[address], help="run the service")
+    serve.add_argument("--workers", type=int, default=None)
+    serve.add_argument("--scene-directory", default=scene_directory, help="the only folder scenes are loaded from")
+    serve.add_argument("--output-directory", default=output_directory, help="the only folder images are saved to")
+
+    for name in ("render", "local"):
+        command = commands.add_parser(
+            name,
+            parents=[address],
+            help="render on the service" if name == "render" else "render in this process",
+        )
+        command.add_argument("scene", help="a Python file that defines scene and camera")
+        command.add_argument("--width", type=int, default=None)
+        command.add_argument("--height", type=int, default=None)
+        command.add_argument(
+            "--output",
+            default=None,
+            help="image to save, inside the service's output folder" if name == "render" else "image to save",
+        )
+        if name == "render":
+            command.add_argument("--priority", type=int, default=0)
+            command.add_argument("--compare", action="store_true", help="also time a cold process render")
+
+    cancel = commands.add_parser("cancel", parents=[address], help="cancel a job")
+    cancel.add_argument("job", type=int)
+
+    commands.add_parser("status", parents=[address], help="list jobs")
+
+    arguments = parser.parse_args()
+
+    if arguments.command == "serve":
+        asyncio.run(_serve(arguments))
+
+    elif arguments.command == "local":
+        render_locally(arguments.scene, arguments.width, arguments.height, arguments.output)
+
+    elif arguments.command == "render":
+
+        def on_event(event):
+            if event["event"] == "progress":
+                print(f"Job {event['job']}: {event['done']}/{event['total']} tiles", end="\r")
+            elif event["event"] == "queued":
+                print(f"Job {event['job']} queued" + (" (joined a pending job)" if event["coalesced"] else ""))
+
+        start_time = time.time()
+        event = asyncio.run(
+            request(
+                {
+                    "command": "render",
+                    "scene": os.path.abspath(arguments.scene),
+                    "width": arguments.width,
+                    "height": arguments.height,
+                    "priority": arguments.priority,
+                    "output": arguments.output,
+                },
+                arguments.host,
+                arguments.port,
+                on_event,
+            )
+        )
+        latency = time.time() - start_time
+
+        print()
+        print(f"Job {event['event']}, latency {latency:.2f} seconds")
+
+        if arguments.compare:
+            cold = time_cold_render(arguments.scene, arguments.width, arguments.height)
+            print(f"Cold process render: {cold:.2f} seconds")
+
+    else:
+        message = {"command": arguments.command}
+        if arguments.command == "cancel":
+            message["job"] = arguments.job
+
+        print(json.dumps(asyncio.run(request(message, arguments.host, arguments.port)), indent=4))
+
+
+if __name__ == "__main__":
+    main()
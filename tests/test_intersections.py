@@ -0,0 +1,63 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Imports
+import numpy as np
+import pytest
+from scene.materials import BaseMaterial
+from scene.objects.primative import Sphere, Plane
+
+material = BaseMaterial((255, 255, 255))
+
+
+def march(object, origins, directions, max_distance=100, min_distance=1e-12, steps=100000):
+    """Sphere traces rays against an object's distance alone, as the renderer would without `getIntersections`."""
+
+    traveled = np.zeros(len(origins))
+    active = np.arange(len(origins))
+
+    # Rays that graze a plane close in on it slowly, so keep going until every ray is done
+    for _ in range(steps):
+        d = object.getSDFs(origins[active] + directions[active] * traveled[active, np.newaxis])
+        moving = d > min_distance
+        traveled[active[moving]] += d[moving]
+
+        active = active[moving & (traveled[active] < max_distance)]
+        if not len(active):
+            break
+
+    # Rays that started inside never move, the rest either reached the surface or went past `max_distance`
+    return np.where(traveled < max_distance, traveled, np.inf)
+
+
+def random_rays(count=500):
+    rng = np.random.default_rng(0)
+    origins = rng.uniform(-3, 3, (count, 3))
+    directions = rng.normal(size=(count, 3))
+    return origins, directions / np.linalg.norm(directions, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize(
+    "object",
+    [
+        Sphere((0.5, 0, -0.5), 1, material),
+        Plane("X", 0.5, material),
+        Plane("Y", -1, material),
+        Plane("Z", 0, material),
+    ],
+    ids=["sphere", "plane x", "plane y", "plane z"],
+)
+def test_intersections_match_march(object):
+    origins, directions = random_rays()
+
+    expected = march(object, origins, directions)
+    distances = object.getIntersections(origins, directions)
+
+    # Hits beyond where the march gives up are misses to it
+    distances = np.where(distances < 100, distances, np.inf)
+
+    # Both miss the same rays, and agree where the others hit
+    np.testing.assert_array_equal(np.isinf(distances), np.isinf(expected))
+    hit = np.isfinite(expected)
+    np.testing.assert_allclose(distances[hit], expected[hit], rtol=0, atol=1e-9)
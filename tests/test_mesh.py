@@ -0,0 +1,43 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Imports
+import numpy as np
+import pytest
+import trimesh
+from scene.objects import mesh_cache
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def cache_directory(tmp_path, monkeypatch):
+    # Keep parsed meshes out of the repository
+    monkeypatch.setattr(mesh_cache, "cache_directory", str(tmp_path / "mesh_cache"))
+    monkeypatch.setattr(mesh_cache, "_geometries", {})
+
+
+@pytest.mark.parametrize("file_name", ["box.stl", "eevee_lowpoly_flowalistik.STL"])
+def test_distances_match_trimesh(file_name):
+    path = os.path.join(root, file_name)
+    mesh = trimesh.load(path, force="mesh")
+    geometry = mesh_cache.load_geometry(path)
+
+    # Points all around the mesh, and some right on and next to its surface
+    rng = np.random.default_rng(0)
+    low, high = mesh.bounds
+    size = np.max(high - low)
+    points = np.concatenate(
+        (
+            rng.uniform(low - size * 0.2, high + size * 0.2, (1000, 3)),
+            mesh.triangles_center,
+            mesh.vertices + rng.normal(0, size * 1e-3, mesh.vertices.shape),
+        )
+    )
+
+    # trimesh counts the inside as positive
+    expected = -trimesh.proximity.signed_distance(mesh, points)
+
+    assert geometry.watertight
+    np.testing.assert_allclose(geometry.getDistances(points), expected, rtol=0, atol=size * 1e-11)
@@ -0,0 +1,295 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Imports
+import asyncio
+import json
+import pytest
+from PIL import Image
+import service
+from service import RenderService, request
+
+# A scene small enough to render in moments, in its own file like `ray_marching.py`
+scene_source = """
+from scene.scene import Scene
+from scene.materials import BaseMaterial
+from scene.objects.primative import Sphere, Plane
+from scene.lights import PointLight
+from camera import Camera
+
+image_width = 8
+image_height = 8
+
+camera = Camera((0, -1.5, -0.5))
+
+scene = Scene(
+    (Plane("Z", 0, BaseMaterial((4, 111, 147))), Sphere((0, 0, -0.4), 0.4, BaseMaterial((177, 103, 57)))),
+    (PointLight((-1, -1, -1), 2, (255, 255, 255)),),
+    0.001,
+    25,
+    True,
+)
+"""
+
+
+@pytest.fixture
+def scene_file(tmp_path):
+    path = tmp_path / "scene.py"
+    path.write_text(scene_source)
+    return str(path)
+
+
+def run_service(test, directory, workers: int = 2):
+    """Runs `test(service)` against a service on a free localhost port, serving scenes in `directory`."""
+
+    async def main():
+        render_service = RenderService("127.0.0.1", 0, workers, str(directory), str(directory / "renders"))
+        await render_service.start()
+
+        try:
+            await asyncio.wait_for(test(render_service), 60)
+        finally:
+            await render_service.close()
+
+    asyncio.run(main())
+
+
+async def render(render_service, on_event=None, **message):
+    if isinstance(on_event, list):
+        on_event = on_event.append
+
+    return await request({"command": "render", **message}, render_service.host, render_service.port, on_event)
+
+
+def dispatchers_alive(render_service) -> bool:
+    return all(not task.done() for task in render_service.tasks)
+
+
+def rendered(tmp_path, output: str) -> str:
+    """Where the service saves an output it was sent."""
+
+    return os.path.realpath(tmp_path / "renders" / output)
+
+
+def test_render_completes(scene_file, tmp_path):
+    output = "image.png"
+
+    async def test(render_service):
+        events = []
+        event = await render(render_service, events, scene=scene_file, width=12, height=10, output=output)
+
+        assert event["event"] == "done"
+        assert event["outputs"] == [rendered(tmp_path, output)]
+        assert [event["event"] for event in events[:2]] == ["queued", "started"]
+
+        with Image.open(rendered(tmp_path, output)) as image:
+            assert image.size == (12, 10)
+
+        # Finished jobs keep their status, not their image
+        job = render_service.jobs[event["job"]]
+        assert job.state == "done" and job.colors is None
+        assert not render_service.active
+
+    run_service(test, tmp_path)
+
+
+def test_render_uses_scene_resolution(scene_file, tmp_path):
+    async def test(render_service):
+        # Scenes can also be given relative to the scene directory, and outputs can be in subfolders
+        event = await render(render_service, scene="scene.py", output="resolution/image.png")
+        assert event["event"] == "done"
+
+        with Image.open(rendered(tmp_path, "resolution/image.png")) as image:
+            assert image.size == (8, 8)
+
+    run_service(test, tmp_path)
+
+
+def test_progress_events(scene_file, tmp_path):
+    async def test(render_service):
+        events = []
+        await render(render_service, events, scene=scene_file, width=4, height=18, output="image.png")
+
+        progress = [event for event in events if event["event"] == "progress"]
+        tiles = -(-18 // service.rows_per_tile)
+
+        assert [event["done"] for event in progress] == list(range(1, tiles + 1))
+        assert all(event["total"] == tiles for event in progress)
+
+    run_service(test, tmp_path)
+
+
+def test_identical_requests_coalesce(scene_file, tmp_path):
+    outputs = ["first.png", "second.png"]
+
+    async def test(render_service):
+        first, first_coalesced = await render_service.submit(scene_file, 8, 64, 0, outputs[0])
+        second, second_coalesced = await render_service.submit(scene_file, 8, 64, 0, outputs[1])
+
+        assert second is first
+        assert not first_coalesced and second_coalesced
+
+        events = []
+        event = await render(render_service, events, scene=scene_file, width=8, height=64, output=outputs[1])
+        assert events[0]["job"] == first.id
+
+        # The request may have come in after the job finished, then it's a new job with the same image
+        if events[0]["coalesced"]:
+            assert event["outputs"] == [rendered(tmp_path, output) for output in outputs]
+        else:
+            assert event["event"] == "done"
+
+        for output in outputs:
+            assert os.path.exists(rendered(tmp_path, output))
+
+    run_service(test, tmp_path, workers=1)
+
+
+def test_cancel(scene_file, tmp_path):
+    async def test(render_service):
+        events = []
+        cancelled = asyncio.Event()
+
+        def on_event(event):
+            events.append(event)
+
+            if event["event"] == "progress" and not cancelled.is_set():
+                cancelled.set()
+                assert render_service.cancel(event["job"])
+
+        event = await render(
+            render_service, on_event, scene=scene_file, width=4, height=400, output="image.png"
+        )
+
+        assert event["event"] == "cancelled"
+        assert not os.path.exists(rendered(tmp_path, "image.png"))
+        assert not render_service.active
+
+        # Cancelling twice, or cancelling a job that doesn't exist, is an error
+        reply = await request(
+            {"command": "cancel", "job": event["job"]}, render_service.host, render_service.port
+        )
+        assert reply["event"] == "error"
+
+    run_service(test, tmp_path, workers=1)
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        {"width": "abc"},
+        {"width": 8, "height": 0},
+        {"width": -4},
+        {"width": 8.5},
+        {"priority": "high"},
+        {"output": "/tmp/x.png"},
+        {"output": "../x.png"},
+        {"output": "sub/../../x.png"},
+        {"output": "."},
+        {"output": 5},
+        {"scene": "/etc/hostname"},
+        {"scene": "../scene.py"},
+        {"scene": "scene.txt"},
+    ],
+)
+def test_bad_requests_are_rejected(scene_file, tmp_path, message):
+    (tmp_path / "scene.txt").write_text(scene_source)
+
+    async def test(render_service):
+        bad_request = {"scene": scene_file, "output": "image.png", **message}
+        event = await render(render_service, **bad_request)
+
+        assert event["event"] == "error"
+        assert not render_service.jobs and not render_service.active
+        assert not os.path.exists(tmp_path / "x.png")
+
+        # The service carries on as before
+        event = await render(render_service, scene=scene_file, width=4, height=4, output="image.png")
+        assert event["event"] == "done"
+        assert dispatchers_alive(render_service)
+
+    run_service(test, tmp_path)
+
+
+def test_missing_scene_is_rejected(tmp_path):
+    async def test(render_service):
+        event = await render(render_service, scene=str(tmp_path / "missing.py"), width=4, height=4)
+        assert event["event"] == "error"
+
+    run_service(test, tmp_path)
+
+
+def test_failed_render(tmp_path):
+    # Runs fine, but has no camera to render from
+    path = tmp_path / "broken.py"
+    path.write_text("scene = None\n")
+
+    async def test(render_service):
+        event = await render(render_service, scene=str(path), width=4, height=8, output="image.png")
+
+        assert event["event"] == "failed"
+        assert not render_service.active
+        assert dispatchers_alive(render_service)
+
+    run_service(test, tmp_path)
+
+
+def test_failed_save(scene_file, tmp_path, monkeypatch):
+    def save_image(colors, output):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(service, "save_image", save_image)
+    output = "image.png"
+
+    async def test(render_service):
+        event = await render(render_service, scene=scene_file, width=4, height=4, output=output)
+
+        assert event["event"] == "failed"
+        assert "disk full" in event["error"]
+        assert not render_service.active
+        assert dispatchers_alive(render_service)
+
+        # An identical request starts a new job, rather than joining the failed one
+        events = []
+        event = await render(render_service, events, scene=scene_file, width=4, height=4, output=output)
+        assert event["event"] == "failed"
+        assert not events[0]["coalesced"]
+
+    run_service(test, tmp_path)
+
+
+def test_finished_jobs_are_pruned(scene_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(service, "max_finished_jobs", 2)
+
+    async def test(render_service):
+        output = "image.png"
+
+        for size in range(1, 5):
+            event = await render(render_service, scene=scene_file, width=size, height=size, output=output)
+            assert event["event"] == "done"
+
+        assert sorted(render_service.jobs) == [3, 4]
+
+        reply = await request({"command": "status"}, render_service.host, render_service.port)
+        assert [job["job"] for job in reply["jobs"]] == [3, 4]
+
+    run_service(test, tmp_path)
+
+
+def test_invalid_line_closes_the_connection(scene_file, tmp_path):
+    async def test(render_service):
+        reader, writer = await asyncio.open_connection(render_service.host, render_service.port)
+
+        # What a web page posting to the service sends, with a valid request as its body
+        body = json.dumps({"command": "render", "scene": scene_file, "width": 4, "height": 4})
+        writer.write(f"POST / HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n{body}\n".encode())
+        await writer.drain()
+
+        replies = [json.loads(line) for line in (await reader.read()).splitlines()]
+        writer.close()
+
+        assert [reply["event"] for reply in replies] == ["error"]
+        assert not render_service.jobs
+
+    run_service(test, tmp_path)
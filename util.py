@@ -1,28 +1,106 @@
 import numpy as np
 import math
+import os
+
+# Floating point type for ray state, scene parameters and mesh data, see `set_precision`
+_dtype = np.float64
+
+
+def set_precision(precision: str):
+    """
+    Sets the floating point precision used across the renderer.
+
+    Scenes, cameras and meshes pick the precision up when they are created,
+    so set it before building the scene.
+
+    ## Args:
+        `precision`: Either "float64" or "float32".
+    """
+
+    global _dtype
+
+    if precision not in ("float64", "float32"):
+        raise ValueError(f'Invalid precision "{precision}", try "float64" or "float32".')
+
+    _dtype = np.dtype(precision).type
+
+
+def get_dtype():
+    return _dtype
+
+
+def save_atomically(path: str, save):
+    """
+    Writes a file through a temporary file next to it, so no reader, crash or
+    other process ever sees half a file.
+
+    ## Args:
+        `path`: Where the file ends up. Missing folders are created.
+        `save`: Called with the temporary path to write the file to, keeping `path`'s extension.
+
+    ## Raises:
+        `OSError`: The file could not be written.
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    root, extension = os.path.splitext(path)
+    temporary = f"{root}.{os.getpid()}.tmp{extension}"
+
+    try:
+        save(temporary)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def as_real(value) -> np.ndarray:
+    """Converts a vector to an array of the current precision."""
+    return np.asarray(value, dtype=_dtype)
+
+
+def get_hit_epsilon(min_distance: float, magnitude: float) -> float:
+    """
+    Raises a hit distance to what the current precision can resolve.
+
+    ## Args:
+        `min_distance`: The requested hit distance.
+        `magnitude`: The largest coordinate involved, positions this far out are this coarse.
+            An array of magnitudes gives an array of distances.
+
+    ## Returns:
+        `min_distance`, or more if steps that small would get lost in rounding.
+    """
+
+    return np.maximum(min_distance, magnitude * np.finfo(_dtype).eps * 64)
+
+
+def get_normal_epsilon(magnitude: float) -> float:
+    """
+    Calculates the offset for finite difference normals at a position.
+
+    ## Args:
+        `magnitude`: The largest coordinate of the position, or an array of them.
+
+    ## Returns:
+        0.001, or more where rounding would swamp the difference in distances.
+    """
+
+    return np.maximum(0.001, magnitude * math.sqrt(np.finfo(_dtype).eps))
+
 
 def normalize(array: np.ndarray):
 
     if np.max(np.abs(array)) == 0:
-        return np.zeros(len(array))
+        return np.zeros(len(array), dtype=_dtype)
 
     magnitude = math.dist(array, (0, 0, 0))
-    normalized_array = np.divide(array, magnitude)
+    normalized_array = np.divide(as_real(array), magnitude)
 
     return normalized_array
 
 
-def get_initial_velocity(x, y, image_width, image_height, fov, camera_rotation):
-    return np.add(
-        (
-            cast(x, 0, image_width * fov, -1, 1),
-            1.0,
-            cast(y, 0, image_height * fov, -0.5625, 0.5625),
-        ),
-        camera_rotation,
-    )
-
-
 def cast(value, old_min, old_max, new_min, new_max):
     return (((value - old_min) * (new_max - new_min)) / (old_max - old_min)) + new_min
 